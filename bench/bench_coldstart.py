@@ -0,0 +1,118 @@
+"""
+Tracker restart recovery: time until a NEED resolves again after a restart.
+
+  warm   the tracker loads swarm.json (+ swarm.log) and answers from the
+         provisional owners right away
+  cold   empty DB (the old behaviour): nothing resolves until the peers have
+         re-announced; here every owner re-sends its OWN as fast as the client
+         can, real peers only do so on their next sync pass
+
+    PYTHONPATH=. python bench/bench_coldstart.py [owners,...]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import multiprocessing as mp
+
+os.environ.setdefault("TRACKER_PORT", "13998")
+
+from common.constants import TRACKER_PORT, BUFFER_SIZE, MODE_NEED, MODE_OWN  # noqa: E402
+from common.utils import jencode, jdecode  # noqa: E402
+from tracker.tracker import Tracker  # noqa: E402
+
+PEERS_PER_SWARM = 20
+DST = ("127.0.0.1", TRACKER_PORT)
+
+
+def _ih(i: int) -> str:
+    return f"{i:064x}"
+
+
+def _meta(s: int):
+    return {"filename": f"f{s}.bin", "size": 1 << 22, "piece_size": 1 << 18, "piece_hashes": [f"{s:064x}"] * 16}
+
+
+def build_db(db_dir: str, owners: int) -> None:
+    swarm = {}
+    swarms = (owners + PEERS_PER_SWARM - 1) // PEERS_PER_SWARM
+    for s in range(swarms):
+        ids = range(s * PEERS_PER_SWARM, min(owners, (s + 1) * PEERS_PER_SWARM))
+        swarm[_ih(s)] = {
+            "meta": _meta(s),
+            "owners": [{"node_id": n, "host": "10.0.0.1", "port": 20000 + n % 1000} for n in ids],
+            "last_seen": {str(n): 0 for n in ids},
+        }
+    with open(os.path.join(db_dir, "swarm.json"), "w", encoding="utf-8") as fp:
+        json.dump(swarm, fp, separators=(",", ":"))
+
+
+def run_tracker(db_dir: str) -> None:
+    sys.stdout = open(os.devnull, "w")
+    os.environ["TRACKER_DB_DIR"] = db_dir
+    Tracker().serve()
+
+
+def need(sock: socket.socket, ih: str):
+    """True/False = tracker answered (found or not), None = no answer yet."""
+    sock.sendto(jencode({"mode": MODE_NEED, "node_id": -1, "infohash": ih}), DST)
+    try:
+        return bool(jdecode(sock.recvfrom(BUFFER_SIZE)[0]).get("ok"))
+    except socket.timeout:
+        return None
+
+
+def reannounce(sock: socket.socket, owners: int) -> None:
+    for n in range(owners):
+        s = n // PEERS_PER_SWARM
+        msg = {"mode": MODE_OWN, "node_id": n, "host": "10.0.0.1", "port": 20000 + n % 1000,
+               "infohash": _ih(s), "meta": _meta(s)}
+        sock.sendto(jencode(msg), DST)
+        if n % 200 == 199:
+            time.sleep(0.001)  # stay under the tracker's receive buffer
+
+
+def measure(owners: int, warm: bool) -> float:
+    with tempfile.TemporaryDirectory(prefix="bench_coldstart_") as db_dir:
+        swarms = (owners + PEERS_PER_SWARM - 1) // PEERS_PER_SWARM
+        if warm:
+            build_db(db_dir, owners)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(0.005)
+        last = _ih(swarms - 1)
+        t0 = time.perf_counter()
+        proc = mp.Process(target=run_tracker, args=(db_dir,), daemon=True)
+        proc.start()
+        try:
+            if not warm:
+                while need(sock, "f" * 64) is None:
+                    pass
+                reannounce(sock, owners)
+            resend = time.perf_counter() + 2.0
+            while time.perf_counter() - t0 < 120:
+                if need(sock, last):
+                    return time.perf_counter() - t0
+                if not warm and time.perf_counter() > resend:
+                    # some OWNs were dropped: the peers' next sync pass would announce again
+                    reannounce(sock, owners)
+                    resend = time.perf_counter() + 2.0
+            return float("nan")
+        finally:
+            sock.close()
+            proc.terminate()
+            proc.join()
+
+
+def main() -> None:
+    levels = [int(p) for p in (sys.argv[1] if len(sys.argv) > 1 else "1000,10000,100000").split(",")]
+    for owners in levels:
+        warm = measure(owners, True)
+        cold = measure(owners, False)
+        print(f"owners={owners:<7} swarms={(owners + PEERS_PER_SWARM - 1) // PEERS_PER_SWARM:<6}: "
+              f"warm start {warm * 1000:8.1f}ms   cold re-announce {cold * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
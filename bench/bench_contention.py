@@ -0,0 +1,97 @@
+"""
+Tracker table contention under mixed traffic: one global lock (the old table,
+LIST scanning under it) vs the sharded table with copy-on-write LIST.
+
+Worker threads call the table directly, as the tracker's pool does, with a mix
+of REGISTER heartbeats, NEED lookups, LIST scans and a trickle of OWN updates
+(each one invalidates the LIST snapshot, so it gets rebuilt now and then).
+Reports ops/s and per-op latency; the interesting number is REGISTER/NEED p99
+while LISTs are running.
+
+    PYTHONPATH=. python bench/bench_contention.py [seconds] [swarms,...] [threads]
+"""
+import sys
+import time
+import random
+import threading
+
+from tracker.state import SwarmTable
+
+PEERS_PER_SWARM = 20
+# op -> share of the traffic
+MIX = {"REGISTER": 0.80, "NEED": 0.15, "LIST": 0.04, "OWN": 0.01}
+
+
+def _ih(i: int) -> str:
+    return f"{i:064x}"
+
+
+def _meta(s: int):
+    return {"filename": f"f{s}.bin", "size": 1 << 20, "piece_size": 1 << 18, "piece_hashes": ["0" * 64] * 4}
+
+
+def populate(table: SwarmTable, swarms: int) -> None:
+    swarm = {}
+    for s in range(swarms):
+        ids = range(s * PEERS_PER_SWARM, (s + 1) * PEERS_PER_SWARM)
+        swarm[_ih(s)] = {
+            "meta": _meta(s),
+            "owners": [{"node_id": n, "host": "10.0.0.1", "port": 20000 + n % 1000} for n in ids],
+            "last_seen": {},
+        }
+    table.load(swarm, time.time())
+
+
+def worker(table: SwarmTable, swarms: int, seed: int, end: float, lat: dict) -> None:
+    rnd = random.Random(seed)
+    ops = list(MIX)
+    weights = [MIX[o] for o in ops]
+    while time.perf_counter() < end:
+        op = rnd.choices(ops, weights)[0]
+        s = rnd.randrange(swarms)
+        n = s * PEERS_PER_SWARM + rnd.randrange(PEERS_PER_SWARM)
+        t0 = time.perf_counter()
+        if op == "REGISTER":
+            table.register(_ih(s), str(n))
+        elif op == "NEED":
+            table.need(_ih(s))
+        elif op == "LIST":
+            table.list_page()
+        else:
+            table.own(_ih(s), _meta(s), {"node_id": n, "host": "10.0.0.1", "port": 20000 + n % 1000})
+        lat[op].append(time.perf_counter() - t0)
+
+
+def _pct(xs, q):
+    return xs[min(len(xs) - 1, int(q * len(xs)))] * 1000 if xs else float("nan")
+
+
+def bench(name: str, table: SwarmTable, swarms: int, threads: int, seconds: float) -> None:
+    populate(table, swarms)
+    lats = [{op: [] for op in MIX} for _ in range(threads)]
+    end = time.perf_counter() + seconds
+    ts = [threading.Thread(target=worker, args=(table, swarms, i, end, lats[i])) for i in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    total = sum(len(v) for lat in lats for v in lat.values())
+    parts = []
+    for op in MIX:
+        xs = sorted(x for lat in lats for x in lat[op])
+        parts.append(f"{op} p50={_pct(xs, 0.5):.3f} p99={_pct(xs, 0.99):.2f}ms")
+    print(f"{name:>7} swarms={swarms:<6}: {total / seconds:8.0f} ops/s  " + "  ".join(parts)
+          + f"  list_builds={table.list_builds}")
+
+
+def main() -> None:
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    levels = [int(p) for p in (sys.argv[2] if len(sys.argv) > 2 else "1000,10000").split(",")]
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    for swarms in levels:
+        bench("global", SwarmTable(3600, shards=1, cow_list=False), swarms, threads, seconds)
+        bench("sharded", SwarmTable(3600, shards=16), swarms, threads, seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Peer data plane load test: the old thread-per-GET_PIECE receive loop vs the
+asyncio DatagramProtocol plane (peer.dataplane.DataPlane).
+
+Each server runs in its own process and serves one file from an mmap; the
+client keeps `concurrency` GET_PIECE requests outstanding (closed loop) and
+measures requests/sec and request -> last block latency. Requests whose blocks
+do not all arrive within 2s count as timeouts.
+
+    PYTHONPATH=. python bench/bench_dataplane.py [seconds] [concurrency,...]
+
+Small pieces stress the request rate rather than the bandwidth, e.g.
+    PIECE_SIZE=16384 PYTHONPATH=. python bench/bench_dataplane.py 5 1,16,64,256
+"""
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+import multiprocessing as mp
+from typing import Dict, List, Tuple
+
+from common.constants import PIECE_SIZE, BLOCK_SIZE, SOCK_RCVBUF, T_GET_PIECE
+from common.protocol import is_block_frame, decode_block, ProtocolError
+from common.utils import jencode, jdecode
+from peer.piece_server import MmapCache, piece_view, piece_frames, send_frame
+from peer.dataplane import DataPlane
+
+TIMEOUT = 2.0
+
+
+def _bind() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_RCVBUF)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+def threaded_server(path: str, port_q) -> None:
+    """Pre-asyncio Node._recv_loop: one thread per request."""
+    sock = _bind()
+    cache = MmapCache()
+    port_q.put(sock.getsockname()[1])
+
+    def serve(ih: str, idx: int, addr: Tuple[str, int]) -> None:
+        view = cache.view(path)
+        piece = piece_view(view, idx, PIECE_SIZE)
+        try:
+            for _, parts in piece_frames(ih, idx, piece, BLOCK_SIZE, True):
+                send_frame(sock, parts, addr)
+        finally:
+            piece.release()
+            view.release()
+
+    while True:
+        data, addr = sock.recvfrom(65535)
+        msg = jdecode(data)
+        threading.Thread(target=serve, args=(msg["ih"], msg["piece"], addr), daemon=True).start()
+
+
+def asyncio_server(path: str, port_q) -> None:
+    sock = _bind()
+    cache = MmapCache()
+
+    async def serve(ih: str, idx: int, addr: Tuple[str, int]) -> None:
+        view = cache.view(path)
+        piece = piece_view(view, idx, PIECE_SIZE)
+        try:
+            for _, parts in piece_frames(ih, idx, piece, BLOCK_SIZE, True):
+                if not plane.writable.is_set():
+                    await plane.writable.wait()
+                plane.send_parts(parts, addr)
+        finally:
+            piece.release()
+            view.release()
+
+    def on_datagram(data: bytes, addr: Tuple[str, int]) -> None:
+        msg = jdecode(data)
+        plane.serve(serve, msg["ih"], msg["piece"], addr)
+
+    plane = DataPlane(sock, on_datagram, print)
+    plane.start()
+    port_q.put(sock.getsockname()[1])
+    threading.Event().wait()
+
+
+def load(port: int, concurrency: int, seconds: float, total_pieces: int) -> Dict[str, float]:
+    """Closed-loop client: every slot has its own infohash so responses are matched without ambiguity."""
+    sock = _bind()
+    sock.settimeout(0.05)
+    server = ("127.0.0.1", port)
+    blocks_per_piece = (PIECE_SIZE + BLOCK_SIZE - 1) // BLOCK_SIZE
+    slots = [f"{i:064x}" for i in range(concurrency)]
+    # ih -> (sent at, piece, blocks received)
+    pending: Dict[str, List] = {}
+    latencies: List[float] = []
+    timeouts = 0
+    seq = 0
+
+    def issue(ih: str) -> None:
+        nonlocal seq
+        idx = seq % total_pieces
+        seq += 1
+        pending[ih] = [time.perf_counter(), idx, set()]
+        sock.sendto(jencode({"type": T_GET_PIECE, "ih": ih, "piece": idx, "wire": 1}), server)
+
+    t0 = time.perf_counter()
+    end = t0 + seconds
+    for ih in slots:
+        issue(ih)
+    next_scan = t0 + 0.1
+    while True:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        try:
+            data, _ = sock.recvfrom(65535)
+        except socket.timeout:
+            data = None
+        if data and is_block_frame(data):
+            try:
+                f = decode_block(data)
+            except ProtocolError:
+                continue
+            req = pending.get(f.infohash)
+            if req and req[1] == f.piece:
+                req[2].add(f.block)
+                if len(req[2]) == blocks_per_piece:
+                    latencies.append(time.perf_counter() - req[0])
+                    issue(f.infohash)
+        if now >= next_scan:
+            next_scan = now + 0.1
+            for ih, req in list(pending.items()):
+                if now - req[0] > TIMEOUT:
+                    timeouts += 1
+                    issue(ih)
+    dt = time.perf_counter() - t0
+    sock.close()
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else float("nan")
+    return {"rps": len(latencies) / dt, "p50": p(0.50), "p99": p(0.99), "timeouts": timeouts}
+
+
+def main() -> None:
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    levels = [int(c) for c in (sys.argv[2] if len(sys.argv) > 2 else "1,16,64,256").split(",")]
+    size = max(64 * 1024 * 1024, PIECE_SIZE * max(levels))
+
+    fd, path = tempfile.mkstemp(prefix="bench_dataplane_")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            for _ in range(size // (1024 * 1024)):
+                fp.write(os.urandom(1024 * 1024))
+        total_pieces = size // PIECE_SIZE
+        print(f"file={size >> 20}MB piece={PIECE_SIZE} block={BLOCK_SIZE} {seconds:.0f}s per run")
+
+        for label, target in (("threaded", threaded_server), ("asyncio", asyncio_server)):
+            q = mp.Queue()
+            proc = mp.Process(target=target, args=(path, q), daemon=True)
+            proc.start()
+            port = q.get()
+            try:
+                for c in levels:
+                    r = load(port, c, seconds, total_pieces)
+                    print(f"{label:>9} c={c:<4}: {r['rps']:8.0f} req/s  p50={r['p50']:7.1f}ms  "
+                          f"p99={r['p99']:7.1f}ms  timeouts={r['timeouts']}")
+                    time.sleep(TIMEOUT)  # let stragglers of the previous level drain
+            finally:
+                proc.terminate()
+                proc.join()
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Piece serving microbenchmark: the old open/read/slice/sendto path vs the
+mmap + sendmsg path in peer.piece_server.
+
+Reports blocks/sec and MB/s for both. Blocks are
+sent over loopback to a socket nobody reads, so the kernel drops them once its
+buffer is full; that is what we want, since only the sender is measured.
+
+    PYTHONPATH=. python bench/bench_serve.py [size_mb] [pieces]
+"""
+import os
+import sys
+import time
+import socket
+import tempfile
+
+from common.constants import PIECE_SIZE, BLOCK_SIZE
+from common.protocol import encode_block
+from peer.piece_server import MmapCache, piece_view, piece_frames, send_frame
+
+IH = "ab" * 32
+
+
+def serve_old(sock, addr, path: str, idx: int) -> None:
+    """Pre-mmap _serve_piece (binary frame): read, slice and concatenate every block."""
+    with open(path, "rb") as f:
+        f.seek(idx * PIECE_SIZE)
+        piece = f.read(PIECE_SIZE)
+    total_blocks = (len(piece) + BLOCK_SIZE - 1) // BLOCK_SIZE
+    for b in range(total_blocks):
+        blk = piece[b * BLOCK_SIZE : (b + 1) * BLOCK_SIZE]
+        sock.sendto(encode_block(IH, idx, b, total_blocks, blk), addr)
+
+
+def serve_new(sock, addr, cache: MmapCache, path: str, idx: int) -> None:
+    """Node._serve_piece without the loop: header + mmap slice gathered by sendmsg."""
+    view = cache.view(path)
+    piece = piece_view(view, idx, PIECE_SIZE)
+    try:
+        for _, parts in piece_frames(IH, idx, piece, BLOCK_SIZE, True):
+            send_frame(sock, parts, addr)
+    finally:
+        piece.release()
+        view.release()
+
+
+def run(label: str, fn, pieces: int, total_pieces: int) -> None:
+    t0 = time.perf_counter()
+    for i in range(pieces):
+        fn(i % total_pieces)
+    dt = time.perf_counter() - t0
+    blocks = pieces * (PIECE_SIZE // BLOCK_SIZE)
+    print(f"{label:>14}: {blocks / dt:10.0f} blocks/s  {pieces * PIECE_SIZE / dt / 1e6:8.1f} MB/s")
+
+
+def main() -> None:
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    pieces = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    fd, path = tempfile.mkstemp(prefix="bench_serve_")
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = sink.getsockname()
+    cache = MmapCache()
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            for _ in range(size_mb):
+                fp.write(os.urandom(1024 * 1024))
+        total_pieces = size_mb * 1024 * 1024 // PIECE_SIZE
+
+        print(f"file={size_mb}MB piece={PIECE_SIZE} block={BLOCK_SIZE} pieces_served={pieces}")
+        run("read+sendto", lambda i: serve_old(sock, addr, path, i), pieces, total_pieces)
+        run("mmap+sendmsg", lambda i: serve_new(sock, addr, cache, path, i), pieces, total_pieces)
+    finally:
+        cache.clear()
+        sock.close()
+        sink.close()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
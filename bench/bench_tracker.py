@@ -0,0 +1,152 @@
+"""
+Tracker announce throughput: the old thread-per-datagram serve loop vs the
+worker pool with batched receive and load shedding.
+
+The tracker runs in a child process with N simulated peers already in the
+swarm table (20 peers per swarm). The client blasts REGISTER heartbeats from
+random peers as fast as it can for a few seconds while a probe sends one NEED
+every 20ms, so besides announces/sec we see whether lookups stay answerable.
+
+    PYTHONPATH=. python bench/bench_tracker.py [seconds] [peers,...]
+"""
+import os
+import sys
+import time
+import random
+import socket
+import tempfile
+import threading
+import multiprocessing as mp
+
+os.environ.setdefault("TRACKER_PORT", "13999")
+os.environ.setdefault("TRACKER_TTL_SEC", "3600")  # no GC expiry during the run
+
+from common.constants import TRACKER_PORT, BUFFER_SIZE, MODE_REGISTER, MODE_NEED  # noqa: E402
+from common.utils import jencode, jdecode  # noqa: E402
+from tracker.tracker import Tracker  # noqa: E402
+
+PEERS_PER_SWARM = 20
+
+
+def _ih(i: int) -> str:
+    return f"{i:064x}"
+
+
+def populate(t: Tracker, peers: int) -> None:
+    now = time.time()
+    for s in range((peers + PEERS_PER_SWARM - 1) // PEERS_PER_SWARM):
+        ids = range(s * PEERS_PER_SWARM, min(peers, (s + 1) * PEERS_PER_SWARM))
+        t.table.shard(_ih(s)).swarm[_ih(s)] = {
+            "meta": {"filename": f"f{s}.bin", "size": 1 << 20, "piece_size": 1 << 18, "piece_hashes": ["0" * 64] * 4},
+            "owners": [{"node_id": n, "host": "10.0.0.1", "port": 20000 + n % 1000} for n in ids],
+            "last_seen": {str(n): now for n in ids},
+        }
+
+
+def legacy_serve(t: Tracker) -> None:
+    """Tracker.serve before the worker pool."""
+    threading.Thread(target=t._gc_loop, daemon=True).start()
+    while True:
+        data, addr = t.sock.recvfrom(BUFFER_SIZE)
+        try:
+            msg = jdecode(data)
+        except Exception:
+            continue
+        threading.Thread(target=t.handle, args=(msg, addr), daemon=True).start()
+
+
+def run_tracker(mode: str, peers: int, db_dir: str, counter, ready) -> None:
+    sys.stdout = open(os.devnull, "w")
+    os.environ["TRACKER_DB_DIR"] = db_dir
+    t = Tracker()
+    populate(t, peers)
+    handle = t.handle
+
+    def counted(msg, addr):
+        handle(msg, addr)
+        if msg.get("mode") == MODE_REGISTER:
+            with counter.get_lock():
+                counter.value += 1
+
+    t.handle = counted
+    ready.set()
+    if mode == "legacy":
+        legacy_serve(t)
+    else:
+        t.serve()
+
+
+def probe(stop: threading.Event, out: dict) -> None:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(1.0)
+    lat = []
+    busy = timeouts = 0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        sock.sendto(jencode({"mode": MODE_NEED, "node_id": -1, "infohash": _ih(0)}), ("127.0.0.1", TRACKER_PORT))
+        try:
+            resp = jdecode(sock.recvfrom(BUFFER_SIZE)[0])
+            if resp.get("error") == "BUSY":
+                busy += 1
+            else:
+                lat.append(time.perf_counter() - t0)
+        except socket.timeout:
+            timeouts += 1
+        time.sleep(0.02)
+    sock.close()
+    lat.sort()
+    out["p99"] = lat[min(len(lat) - 1, int(0.99 * len(lat)))] * 1000 if lat else float("nan")
+    out["ok"], out["busy"], out["timeouts"] = len(lat), busy, timeouts
+
+
+def bench(mode: str, peers: int, seconds: float) -> None:
+    counter = mp.Value("q", 0)
+    ready = mp.Event()
+    with tempfile.TemporaryDirectory(prefix="bench_tracker_") as db_dir:
+        proc = mp.Process(target=run_tracker, args=(mode, peers, db_dir, counter, ready), daemon=True)
+        proc.start()
+        ready.wait()
+        time.sleep(0.2)
+
+        swarms = (peers + PEERS_PER_SWARM - 1) // PEERS_PER_SWARM
+        rnd = random.Random(1)
+        msgs = []
+        for _ in range(4096):
+            n = rnd.randrange(peers)
+            msgs.append(jencode({"mode": MODE_REGISTER, "node_id": n, "infohash": _ih(min(swarms - 1, n // PEERS_PER_SWARM))}))
+
+        stop = threading.Event()
+        out: dict = {}
+        prober = threading.Thread(target=probe, args=(stop, out))
+        prober.start()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        dst = ("127.0.0.1", TRACKER_PORT)
+        sent = 0
+        t0 = time.perf_counter()
+        end = t0 + seconds
+        while time.perf_counter() < end:
+            for m in msgs[:256]:
+                sock.sendto(m, dst)
+            sent += 256
+            msgs.append(msgs.pop(0))
+        dt = time.perf_counter() - t0
+        handled = counter.value
+        stop.set()
+        prober.join()
+        sock.close()
+        proc.terminate()
+        proc.join()
+    print(f"{mode:>7} peers={peers:<7}: {handled / dt:9.0f} announces/s  offered={sent / dt:9.0f}/s  "
+          f"NEED ok={out['ok']} busy={out['busy']} timeout={out['timeouts']} p99={out['p99']:.1f}ms")
+
+
+def main() -> None:
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    levels = [int(p) for p in (sys.argv[2] if len(sys.argv) > 2 else "1000,10000,100000").split(",")]
+    for peers in levels:
+        for mode in ("legacy", "pool"):
+            bench(mode, peers, seconds)
+
+
+if __name__ == "__main__":
+    main()
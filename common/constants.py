@@ -7,14 +7,62 @@ ADVERTISE_HOST = os.getenv("ADVERTISE_HOST", "peer1")
 NODE_PORT = int(os.getenv("NODE_PORT", "20001"))
 
 BUFFER_SIZE = int(os.getenv("BUFFER_SIZE", "65535"))
+SOCK_RCVBUF = int(os.getenv("SOCK_RCVBUF", str(4 * 1024 * 1024)))  # kernel clamps to net.core.rmem_max
+LIST_PAGE_BYTES = int(os.getenv("LIST_PAGE_BYTES", str(48 * 1024)))  # tracker LIST page, leaves room for the envelope
+META_INLINE_BYTES = int(os.getenv("META_INLINE_BYTES", str(16 * 1024)))  # larger metadata is announced compact
+META_CHUNK_HASHES = int(os.getenv("META_CHUNK_HASHES", "1024"))  # piece hashes per metadata chunk (32KB raw)
 
 PIECE_SIZE = int(os.getenv("PIECE_SIZE", str(256 * 1024)))  # 256KB pieces
 BLOCK_SIZE = int(os.getenv("BLOCK_SIZE", str(8 * 1024)))    # 8KB UDP blocks (safe)
+# "merkle": piece hashes are Merkle roots over BLOCK_SIZE leaves, so every block is checked on arrival
+HASH_MODE = os.getenv("HASH_MODE", "sha256")
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(16, os.cpu_count() or 1))))
+HASH_READAHEAD = int(os.getenv("HASH_READAHEAD", "0"))  # pieces in flight, 0 = 2 * workers
 
 HEARTBEAT_SEC = int(os.getenv("NODE_TIME_INTERVAL", "10"))
+REGISTER_SYNC_BATCH = int(os.getenv("REGISTER_SYNC_BATCH", "512"))  # infohashes per resync REGISTER (~34KB)
+NEED_BATCH = int(os.getenv("NEED_BATCH", "512"))  # infohashes per batched NEED request
+TRACKER_TIMEOUT = float(os.getenv("TRACKER_TIMEOUT", "0.5"))  # first reply wait, doubled on every retry
+TRACKER_RETRIES = int(os.getenv("TRACKER_RETRIES", "2"))  # 0.5 + 1 + 2s before a call gives up
+# peer-side cache of tracker replies (seconds); NOT_FOUND is kept for TRACKER_CACHE_NEG_SEC
+TRACKER_CACHE_NEED_SEC = float(os.getenv("TRACKER_CACHE_NEED_SEC", "5"))
+TRACKER_CACHE_FIND_SEC = float(os.getenv("TRACKER_CACHE_FIND_SEC", "15"))
+TRACKER_CACHE_NEG_SEC = float(os.getenv("TRACKER_CACHE_NEG_SEC", "3"))
+TRACKER_CACHE_ENTRIES = int(os.getenv("TRACKER_CACHE_ENTRIES", "4096"))
+
+PIPELINE_INIT = int(os.getenv("PIPELINE_INIT", "2"))  # pieces in flight per peer at start
+PIPELINE_MAX = int(os.getenv("PIPELINE_MAX", "16"))   # upper bound of the per-peer request window
+
+NACK_MAX_ROUNDS = int(os.getenv("NACK_MAX_ROUNDS", "3"))  # missing-block re-requests before re-queueing a piece
+
+# sender pacing (bytes/sec); CC_MAX_RATE=0 means no cap
+CC_INIT_RATE = int(os.getenv("CC_INIT_RATE", str(4 * 1024 * 1024)))
+CC_MIN_RATE = int(os.getenv("CC_MIN_RATE", str(64 * 1024)))
+CC_MAX_RATE = int(os.getenv("CC_MAX_RATE", "0"))
+# cwnd ceiling (bytes): more than the receiver's socket buffer in one RTT only overflows it
+CC_MAX_CWND = int(os.getenv("CC_MAX_CWND", str(SOCK_RCVBUF)))
+
+BITFIELD_WAIT_SEC = float(os.getenv("BITFIELD_WAIT_SEC", "1.0"))  # silent peers are assumed to be full seeds
+PEER_REFRESH_SEC = float(os.getenv("PEER_REFRESH_SEC", "15"))  # re-ask the tracker for new (partial) peers
+PEER_MAX_FAILURES = int(os.getenv("PEER_MAX_FAILURES", "8"))  # pieces in a row a peer may fail before its worker quits
+DOWNLOAD_STALL_ROUNDS = int(os.getenv("DOWNLOAD_STALL_ROUNDS", "4"))  # refresh periods without progress before giving up
+
+# seed dir change feed: "auto" (inotify, else scanning), "inotify" or "scan"
+SEED_WATCH = os.getenv("SEED_WATCH", "auto")
+SEED_SCAN_SEC = float(os.getenv("SEED_SCAN_SEC", "5"))  # scandir pass interval without inotify
+SEED_RESCAN_SEC = float(os.getenv("SEED_RESCAN_SEC", "60"))  # safety pass with inotify (missed events on bind mounts)
+
+MMAP_CACHE_FILES = int(os.getenv("MMAP_CACHE_FILES", "64"))  # seeded files kept memory-mapped
+LEAF_CACHE_PIECES = int(os.getenv("LEAF_CACHE_PIECES", "4096"))  # Merkle leaf layers kept for serving (~1KB each)
+
+# asyncio data plane: pieces served at once, and requests queued behind them before new ones are dropped
+SERVE_CONCURRENCY = int(os.getenv("SERVE_CONCURRENCY", "64"))
+SERVE_BACKLOG = int(os.getenv("SERVE_BACKLOG", "1024"))
 
 SEED_DIR = os.getenv("SEED_DIR", "node_files")
 DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "downloads")
+CACHE_DIR = os.getenv("CACHE_DIR", "node_cache")
 
 # Tracker modes
 MODE_OWN = "OWN"
@@ -23,7 +71,17 @@ MODE_LIST = "LIST"
 MODE_FIND_BY_NAME = "FIND_BY_NAME"
 MODE_REGISTER = "REGISTER"
 MODE_EXIT = "EXIT"
+MODE_STATS = "STATS"
 
 # Peer msg types
 T_GET_PIECE = "GET_PIECE"
 T_PIECE_BLOCK = "PIECE_BLOCK"
+T_GET_BLOCKS = "GET_BLOCKS"  # selective retransmit (NACK): only the listed block indices of a piece
+T_PIECE_ACK = "PIECE_ACK"    # downloader -> seeder: piece fully received (drives sender congestion control)
+T_GET_BITFIELD = "GET_BITFIELD"  # which pieces do you have?
+T_BITFIELD = "BITFIELD"          # reply: {"seed": true} or packed "bits"
+T_HAVE = "HAVE"                  # peer finished one more piece
+T_CANCEL = "CANCEL"              # endgame: stop sending a piece that arrived from another peer
+T_GET_META = "GET_META"          # piece-hash list chunk of a compact-announced torrent
+T_META = "META"                  # reply: {"chunk", "hashes": base64 of raw digests, "proof": Merkle siblings}
+T_PIECE_HASHES = "PIECE_HASHES"  # Merkle leaves of one piece, sent ahead of its blocks when asked for
@@ -2,8 +2,10 @@
 from __future__ import annotations
 
 import json
+import base64
+import struct
 from dataclasses import dataclass
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Iterable, List, Tuple
 
 
 class ProtocolError(Exception):
@@ -41,3 +43,80 @@ def get_advertised_endpoint(msg: Dict[str, Any], fallback_addr: Tuple[str, int])
     except Exception as e:
         raise ProtocolError(f"Invalid port in message: {port}") from e
     return PeerEndpoint(host=host, port=port_i)
+
+
+def pack_bitfield(completed: Iterable[int]) -> str:
+    """List of 0/1 per piece -> base64 bitfield (MSB first, like BitTorrent)."""
+    flags = list(completed)
+    out = bytearray((len(flags) + 7) // 8)
+    for i, c in enumerate(flags):
+        if c:
+            out[i >> 3] |= 0x80 >> (i & 7)
+    return base64.b64encode(bytes(out)).decode("ascii")
+
+
+def unpack_bitfield(bits: str, total: int) -> List[int]:
+    """base64 bitfield -> indices of the pieces that are set."""
+    try:
+        raw = base64.b64decode(bits.encode("ascii"))
+    except Exception as e:
+        raise ProtocolError(f"invalid bitfield: {e}") from e
+    return [i for i in range(min(total, len(raw) * 8)) if raw[i >> 3] & (0x80 >> (i & 7))]
+
+
+# ---------------- binary PIECE_BLOCK frame ----------------
+# JSON messages always start with "{" (0x7B); binary frames start with BLOCK_MAGIC,
+# so both can share the same UDP socket and old JSON-only peers keep working.
+BLOCK_MAGIC = 0xB7
+BLOCK_WIRE_VERSION = 1
+FRAME_PIECE_BLOCK = 1
+
+# magic, version, type, flags, infohash (32 raw bytes), piece, block, total_blocks
+BLOCK_HEADER = struct.Struct("!BBBB32sIHH")
+
+
+def is_block_frame(raw: bytes) -> bool:
+    return len(raw) >= BLOCK_HEADER.size and raw[0] == BLOCK_MAGIC
+
+
+def infohash_raw(infohash: str) -> bytes:
+    try:
+        ih_raw = bytes.fromhex(infohash)
+    except ValueError as e:
+        raise ProtocolError(f"invalid infohash: {infohash!r}") from e
+    if len(ih_raw) != 32:
+        raise ProtocolError(f"invalid infohash length: {len(ih_raw)}")
+    return ih_raw
+
+
+def pack_block_header_raw(ih_raw: bytes, piece: int, block: int, total_blocks: int, flags: int = 0) -> bytes:
+    return BLOCK_HEADER.pack(BLOCK_MAGIC, BLOCK_WIRE_VERSION, FRAME_PIECE_BLOCK, flags, ih_raw, piece, block, total_blocks)
+
+
+def pack_block_header(infohash: str, piece: int, block: int, total_blocks: int, flags: int = 0) -> bytes:
+    return pack_block_header_raw(infohash_raw(infohash), piece, block, total_blocks, flags)
+
+
+def encode_block(infohash: str, piece: int, block: int, total_blocks: int, payload: bytes) -> bytes:
+    return pack_block_header(infohash, piece, block, total_blocks) + payload
+
+
+@dataclass(frozen=True)
+class BlockFrame:
+    infohash: str
+    piece: int
+    block: int
+    total_blocks: int
+    flags: int
+    payload: memoryview  # zero-copy view into the received datagram
+
+
+def decode_block(raw: bytes) -> BlockFrame:
+    if not is_block_frame(raw):
+        raise ProtocolError("not a block frame")
+    magic, version, ftype, flags, ih_raw, piece, block, total = BLOCK_HEADER.unpack_from(raw)
+    if version != BLOCK_WIRE_VERSION:
+        raise ProtocolError(f"unsupported block frame version {version}")
+    if ftype != FRAME_PIECE_BLOCK:
+        raise ProtocolError(f"unknown block frame type {ftype}")
+    return BlockFrame(ih_raw.hex(), piece, block, total, flags, memoryview(raw)[BLOCK_HEADER.size:])
@@ -14,3 +14,13 @@ def b64e(b: bytes) -> str:
 
 def b64d(s: str) -> bytes:
     return base64.b64decode(s.encode("ascii"))
+
+def ih_fold(ih: str) -> int:
+    """64-bit hash of an infohash; XOR of these over a set is the REGISTER keepalive digest."""
+    return int.from_bytes(hashlib.blake2b(ih.encode("utf-8"), digest_size=8).digest(), "big")
+
+def ih_digest(ihs) -> str:
+    acc = 0
+    for ih in ihs:
+        acc ^= ih_fold(ih)
+    return f"{acc:016x}"
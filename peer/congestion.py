@@ -0,0 +1,133 @@
+import time
+import threading
+from typing import Dict, Any, Tuple, Optional
+
+from common.constants import BLOCK_SIZE, PIECE_SIZE, CC_INIT_RATE, CC_MIN_RATE, CC_MAX_RATE, CC_MAX_CWND
+
+
+class PeerPacer:
+    """
+    Sender-side AIMD congestion control for one destination.
+    - cwnd (bytes) grows by one piece per ACKed piece in slow start, then by ~one piece per RTT,
+      up to CC_MAX_CWND so a long loss-free run cannot build up an unbounded burst
+    - a NACK (GET_BLOCKS) is a loss signal: cwnd is halved, at most once per RTT
+    - blocks are paced through a token bucket refilled at cwnd / srtt bytes per second,
+      so several concurrent requests from one peer share one rate instead of bursting
+    """
+
+    IDLE_SEC = 300.0
+
+    MAX_CWND = float(max(CC_MAX_CWND, 4 * PIECE_SIZE))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cwnd = float(4 * PIECE_SIZE)
+        self.ssthresh = float("inf")
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.tokens = float(4 * BLOCK_SIZE)
+        self.last_refill = time.monotonic()
+        self.last_loss = 0.0
+        self.last_active = self.last_refill
+        self.sent: Dict[Tuple[str, int], float] = {}  # (ih, piece) -> time its last block left
+        self.acks = 0
+        self.losses = 0
+        self.bytes_sent = 0
+
+    @property
+    def rate(self) -> float:
+        if self.srtt is None:
+            rate = float(CC_INIT_RATE)
+        else:
+            rate = self.cwnd / max(self.srtt, 0.001)
+        rate = max(float(CC_MIN_RATE), rate)
+        return min(float(CC_MAX_RATE), rate) if CC_MAX_RATE > 0 else rate
+
+    def reserve(self, nbytes: int) -> float:
+        """Take nbytes from the bucket; returns how long the caller should wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            rate = self.rate
+            burst = max(4 * BLOCK_SIZE, min(self.cwnd, 64 * BLOCK_SIZE))
+            self.tokens = min(burst, self.tokens + (now - self.last_refill) * rate)
+            self.last_refill = now
+            self.last_active = now
+            self.tokens -= nbytes
+            self.bytes_sent += nbytes
+            return -self.tokens / rate if self.tokens < 0 else 0.0
+
+    def on_piece_sent(self, ih: str, piece: int) -> None:
+        with self._lock:
+            self.sent[(ih, piece)] = time.monotonic()
+            if len(self.sent) > 1024:
+                # ACKs that never came back (lost / legacy peer)
+                for k in sorted(self.sent, key=self.sent.get)[:512]:
+                    self.sent.pop(k, None)
+
+    def on_ack(self, ih: str, piece: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            t = self.sent.pop((ih, piece), None)
+            self.acks += 1
+            self.last_active = now
+            if t is not None:
+                rtt = now - t
+                if self.srtt is None:
+                    self.srtt, self.rttvar = rtt, rtt / 2
+                else:
+                    self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                    self.srtt = 0.875 * self.srtt + 0.125 * rtt
+            if self.cwnd < self.ssthresh:
+                self.cwnd += PIECE_SIZE
+            else:
+                self.cwnd += PIECE_SIZE * PIECE_SIZE / self.cwnd
+            self.cwnd = min(self.cwnd, self.MAX_CWND)
+
+    def on_loss(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.losses += 1
+            if now - self.last_loss < (self.srtt or 0.1):
+                return  # one reduction per RTT for a burst of NACKs
+            self.last_loss = now
+            self.ssthresh = max(float(2 * BLOCK_SIZE), self.cwnd / 2)
+            self.cwnd = self.ssthresh
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cwnd_bytes": int(self.cwnd),
+                "rate_bps": int(self.rate),
+                "srtt_ms": round(self.srtt * 1000, 1) if self.srtt is not None else None,
+                "rttvar_ms": round(self.rttvar * 1000, 1),
+                "acks": self.acks,
+                "losses": self.losses,
+                "bytes_sent": self.bytes_sent,
+            }
+
+
+class Pacers:
+    """addr -> PeerPacer, idle destinations are dropped after PeerPacer.IDLE_SEC."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._peers: Dict[Tuple[str, int], PeerPacer] = {}
+
+    def get(self, addr: Tuple[str, int]) -> PeerPacer:
+        with self._lock:
+            p = self._peers.get(addr)
+            if p is None:
+                now = time.monotonic()
+                for a in [a for a, x in self._peers.items() if now - x.last_active > PeerPacer.IDLE_SEC]:
+                    self._peers.pop(a, None)
+                p = self._peers[addr] = PeerPacer()
+            return p
+
+    def peek(self, addr: Tuple[str, int]) -> Optional[PeerPacer]:
+        with self._lock:
+            return self._peers.get(addr)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            items = list(self._peers.items())
+        return {f"{a[0]}:{a[1]}": p.stats() for a, p in items}
@@ -0,0 +1,183 @@
+import asyncio
+import socket
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from common.constants import SERVE_CONCURRENCY, SERVE_BACKLOG
+from peer.piece_server import send_frame
+
+Addr = Tuple[str, int]
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, plane: "DataPlane"):
+        self.plane = plane
+
+    def datagram_received(self, data: bytes, addr: Addr) -> None:
+        try:
+            self.plane.on_datagram(data, addr)
+        except Exception as e:
+            self.plane.log(f"datagram from {addr[0]}:{addr[1]} failed: {e}")
+
+    def error_received(self, exc: Exception) -> None:
+        # ICMP port unreachable etc. from a peer that went away; UDP keeps going
+        pass
+
+    def pause_writing(self) -> None:
+        self.plane.writable.clear()
+
+    def resume_writing(self) -> None:
+        self.plane.writable.set()
+
+
+class Signal:
+    """Wakeup that any thread can fire and coroutines on the plane's loop can wait on (like Condition.wait)."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._waiters: Set[asyncio.Future] = set()
+
+    def fire(self) -> None:
+        self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self) -> None:
+        for fut in self._waiters:
+            if not fut.done():
+                fut.set_result(None)
+        self._waiters.clear()
+
+    async def wait(self, timeout: float) -> None:
+        fut = self._loop.create_future()
+        self._waiters.add(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters.discard(fut)
+
+
+class DataPlane:
+    """
+    The node's UDP socket driven by an asyncio DatagramProtocol on its own event loop thread.
+
+    - every datagram is dispatched to `on_datagram` on the loop thread (must not block)
+    - piece serving runs as tasks, at most SERVE_CONCURRENCY at once; up to SERVE_BACKLOG more
+      wait for a slot and anything beyond that is dropped (the requester's RTO / NACK recovers it)
+    - sends go straight to the socket from any thread; only when the kernel buffer is full are they
+      queued on the transport, whose pause/resume_writing gates the serving tasks
+    Flask and the other blocking threads keep running as before and talk to the loop through
+    sendto / submit.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        on_datagram: Callable[[bytes, Addr], None],
+        log: Callable[[str], None],
+        concurrency: int = SERVE_CONCURRENCY,
+        backlog: int = SERVE_BACKLOG,
+    ):
+        self.sock = sock
+        self.on_datagram = on_datagram
+        self.log = log
+        self.concurrency = max(1, concurrency)
+        self.backlog = max(0, backlog)
+        self.loop = asyncio.new_event_loop()
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.writable = asyncio.Event()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._thread: Optional[threading.Thread] = None
+        self.serving = 0
+        self.queued = 0
+        self.served = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="dataplane", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def _run(self, ready: threading.Event) -> None:
+        asyncio.set_event_loop(self.loop)
+
+        async def setup() -> None:
+            # Event/Semaphore bind to the running loop on older Pythons
+            self.writable = asyncio.Event()
+            self.writable.set()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self.transport, _ = await self.loop.create_datagram_endpoint(lambda: _Protocol(self), sock=self.sock)
+
+        self.loop.run_until_complete(setup())
+        ready.set()
+        self.loop.run_forever()
+
+    # ---------------- sending ----------------
+    def sendto(self, data: bytes, addr: Addr) -> None:
+        """Thread-safe. Errors other than a full send buffer are raised to the caller, as with a plain socket."""
+        self.send_parts([data], addr)
+
+    def send_parts(self, parts: List[Any], addr: Addr) -> None:
+        try:
+            send_frame(self.sock, parts, addr)
+        except BlockingIOError:
+            data = b"".join(parts)
+            if threading.current_thread() is self._thread:
+                self.transport.sendto(data, addr)
+            else:
+                self.loop.call_soon_threadsafe(self.transport.sendto, data, addr)
+
+    # ---------------- tasks ----------------
+    def submit(self, coro: Awaitable[Any]) -> Future:
+        """Run a coroutine on the loop from another thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def spawn(self, coro: Awaitable[Any]) -> asyncio.Task:
+        """Start a background task (loop thread only); keeps a reference so it is not collected."""
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._reap)
+        return task
+
+    def _reap(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.log(f"task {task.get_coro().__qualname__} failed: {task.exception()!r}")
+
+    def serve(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> bool:
+        """Admission control for one request (loop thread only). False = dropped."""
+        if self.serving + self.queued >= self.concurrency + self.backlog:
+            self.dropped += 1
+            return False
+        self.queued += 1
+        self.spawn(self._bounded(fn, args))
+        return True
+
+    async def _bounded(self, fn: Callable[..., Awaitable[Any]], args: Tuple[Any, ...]) -> None:
+        async with self._slots:
+            self.queued -= 1
+            self.serving += 1
+            try:
+                await fn(*args)
+            except Exception as e:
+                self.log(f"serve failed: {e}")
+            finally:
+                self.serving -= 1
+                self.served += 1
+
+    def signal(self) -> Signal:
+        return Signal(self.loop)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "serving": self.serving,
+            "queued": self.queued,
+            "served": self.served,
+            "dropped": self.dropped,
+            "tasks": len(self._tasks),
+            "concurrency": self.concurrency,
+            "backlog": self.backlog,
+        }
@@ -0,0 +1,73 @@
+import os
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, List, Optional
+
+from common.constants import HASH_WORKERS, HASH_READAHEAD
+from peer.merkle import piece_root
+
+ProgressFn = Callable[[int, int], None]  # (pieces_done, total_pieces)
+
+
+def _sha256_hex(data: bytes) -> str:
+    # hashlib drops the GIL for buffers > 2KB, so this scales across threads
+    return hashlib.sha256(data).hexdigest()
+
+
+def _merkle_hex(block_size: int, data: bytes) -> str:
+    return piece_root(data, block_size).hex()
+
+
+def hash_pieces(
+    filepath: str,
+    piece_size: int,
+    workers: int = HASH_WORKERS,
+    readahead: int = HASH_READAHEAD,
+    progress: Optional[ProgressFn] = None,
+    block_size: int = 0,
+) -> List[str]:
+    """
+    SHA-256 of every piece_size piece of filepath, in piece order; with block_size,
+    the Merkle root over the piece's block_size leaves instead.
+    The file is read sequentially on the calling thread (disk friendly) while
+    hashing runs on a thread pool. At most `readahead` pieces are buffered, so
+    memory stays bounded at readahead * piece_size.
+    """
+    size = os.path.getsize(filepath)
+    total = (size + piece_size - 1) // piece_size
+    out: List[str] = []
+    digest = partial(_merkle_hex, block_size) if block_size else _sha256_hex
+
+    if workers <= 1 or total <= 1:
+        with open(filepath, "rb") as fp:
+            while True:
+                piece = fp.read(piece_size)
+                if not piece:
+                    break
+                out.append(digest(piece))
+                if progress:
+                    progress(len(out), total)
+        return out
+
+    if readahead <= 0:
+        readahead = 2 * workers
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash") as pool:
+        with open(filepath, "rb") as fp:
+            while True:
+                piece = fp.read(piece_size)
+                if not piece:
+                    break
+                pending.append(pool.submit(digest, piece))
+                if len(pending) >= readahead:
+                    out.append(pending.popleft().result())
+                    if progress:
+                        progress(len(out), total)
+        while pending:
+            out.append(pending.popleft().result())
+            if progress:
+                progress(len(out), total)
+    return out
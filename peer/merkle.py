@@ -0,0 +1,58 @@
+import hashlib
+from typing import List, Sequence
+
+ZERO = bytes(32)  # padding leaf, as in BitTorrent v2
+
+
+def _h(data) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def next_pow2(n: int) -> int:
+    return 1 << max(0, n - 1).bit_length()
+
+
+def layers(nodes: Sequence[bytes], width: int = 0) -> List[List[bytes]]:
+    """Every level of the tree over `nodes` padded with ZERO to `width` (default: next power of two); root last."""
+    layer = list(nodes) + [ZERO] * (max(width, next_pow2(len(nodes))) - len(nodes))
+    out = [layer]
+    while len(layer) > 1:
+        layer = [_h(layer[i] + layer[i + 1]) for i in range(0, len(layer), 2)]
+        out.append(layer)
+    return out
+
+
+def root(nodes: Sequence[bytes], width: int = 0) -> bytes:
+    return layers(nodes, width)[-1][0]
+
+
+def block_leaves(data, block_size: int) -> List[bytes]:
+    """Leaf hashes of one piece: sha256 of every block_size block (the last one may be short)."""
+    view = memoryview(data)
+    return [_h(view[i:i + block_size]) for i in range(0, len(view), block_size)] or [_h(b"")]
+
+
+def piece_root(data, block_size: int) -> bytes:
+    return root(block_leaves(data, block_size))
+
+
+def subtree_proof(tree: List[List[bytes]], index: int, span: int) -> List[bytes]:
+    """
+    Sibling hashes from the subtree of `span` leaves (a power of two) starting at leaf
+    index * span up to the root of `tree` (from layers()).
+    """
+    level = span.bit_length() - 1
+    i = index
+    out = []
+    for layer in tree[level:-1]:
+        out.append(layer[i ^ 1])
+        i >>= 1
+    return out
+
+
+def verify_subtree(sub_root: bytes, index: int, proof: Sequence[bytes], expected_root: bytes) -> bool:
+    h, i = sub_root, index
+    for sibling in proof:
+        h = _h(h + sibling) if i % 2 == 0 else _h(sibling + h)
+        i >>= 1
+    return h == expected_root
@@ -0,0 +1,150 @@
+import os
+import json
+import tempfile
+import threading
+from typing import Dict, Any, Tuple, Optional, Callable, List
+
+from common.utils import sha256_hex
+from peer.hashing import hash_pieces, ProgressFn
+from peer import merkle
+
+
+def meta_infohash(meta: Dict[str, Any]) -> str:
+    return sha256_hex(json.dumps(meta, sort_keys=True).encode("utf-8"))
+
+
+def compute_meta(
+    filepath: str, piece_size: int, progress: Optional[ProgressFn] = None, block_size: int = 0
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    block_size > 0: Merkle mode, piece_hashes are the roots of per-piece trees over
+    block_size leaves and `root` is the tree over those, so single blocks can be checked.
+    """
+    size = os.path.getsize(filepath)
+    piece_hashes = hash_pieces(filepath, piece_size, progress=progress, block_size=block_size)
+    meta = {
+        "filename": os.path.basename(filepath),
+        "size": size,
+        "piece_size": piece_size,
+        "piece_hashes": piece_hashes,
+    }
+    if block_size:
+        meta["block_size"] = block_size
+        meta["root"] = merkle.root([bytes.fromhex(h) for h in piece_hashes]).hex()
+    return meta_infohash(meta), meta
+
+
+def cache_key(st: os.stat_result, piece_size: int, block_size: int = 0) -> List[int]:
+    key = [st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, piece_size]
+    # flat keys stay as they were, so switching HASH_MODE on does not invalidate them
+    return key + [block_size] if block_size else key
+
+
+class MetaCache:
+    """
+    path -> (infohash, meta) cache keyed on (dev, inode, size, mtime_ns, piece_size).
+    - a hit does no file IO besides one os.stat()
+    - persisted to a sidecar JSON file so restarts do not rehash everything
+    - files this node writes itself (finished downloads) are primed with the
+      already-verified piece hashes and never hashed at all
+    """
+
+    def __init__(self, cache_path: str, piece_size: int, log: Callable[[str], None], block_size: int = 0):
+        self.cache_path = cache_path
+        self.piece_size = piece_size
+        self.block_size = block_size  # Merkle leaf size, 0 = flat piece hashes
+        self._log = log
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer at a time
+        self._entries: Dict[str, Dict[str, Any]] = {}  # path -> {key, ih, meta}
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+        except Exception as e:
+            self._log(f"meta cache load failed: {e}")
+            return
+        # drop entries whose file went away while we were not running
+        entries = {p: ent for p, ent in (data.get("entries") or {}).items() if os.path.exists(p)}
+        with self._lock:
+            self._entries.update(entries)
+        self._log(f"meta cache loaded: {len(self._entries)} entries")
+
+    def save(self) -> None:
+        with self._save_lock:
+            with self._lock:
+                data = {"version": 1, "entries": dict(self._entries)}
+            tmp = None
+            try:
+                d = os.path.dirname(self.cache_path)
+                os.makedirs(d, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(prefix=".meta_cache.", suffix=".tmp", dir=d)
+                with os.fdopen(fd, "w", encoding="utf-8") as fp:
+                    json.dump(data, fp, ensure_ascii=False)
+                os.replace(tmp, self.cache_path)
+            except Exception as e:
+                self._log(f"meta cache save failed: {e}")
+                if tmp and os.path.exists(tmp):
+                    os.unlink(tmp)
+
+    def forget(self, filepath: str) -> None:
+        """The file at `filepath` is gone."""
+        with self._lock:
+            if self._entries.pop(filepath, None) is None:
+                return
+        self.save()
+
+    def peek(self, filepath: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Cached (infohash, meta) if the file is unchanged since it was hashed; never hashes."""
+        try:
+            key = cache_key(os.stat(filepath), self.piece_size, self.block_size)
+        except OSError:
+            return None
+        with self._lock:
+            ent = self._entries.get(filepath)
+            return (ent["ih"], ent["meta"]) if ent and ent["key"] == key else None
+
+    def get(self, filepath: str, progress: Optional[ProgressFn] = None) -> Tuple[str, Dict[str, Any]]:
+        st = os.stat(filepath)
+        key = cache_key(st, self.piece_size, self.block_size)
+        with self._lock:
+            ent = self._entries.get(filepath)
+            if ent and ent["key"] == key:
+                self.hits += 1
+                return ent["ih"], ent["meta"]
+            self.misses += 1
+
+        ih, meta = compute_meta(filepath, self.piece_size, progress, self.block_size)
+        # re-stat: if the file changed while hashing, do not cache a torn result
+        if cache_key(os.stat(filepath), self.piece_size, self.block_size) == key:
+            with self._lock:
+                self._entries[filepath] = {"key": key, "ih": ih, "meta": meta}
+            self.save()
+        return ih, meta
+
+    def prime(self, filepath: str, ih: str, meta: Dict[str, Any], st: Optional[os.stat_result] = None) -> bool:
+        """
+        Record known-good metadata for a file we just wrote (no hashing).
+        `st`: stat of the file about to be renamed to `filepath` (a rename keeps dev, inode and mtime).
+        """
+        if meta.get("piece_size") != self.piece_size or meta_infohash(meta) != ih:
+            return False
+        if st is None:
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                return False
+        if st.st_size != meta.get("size"):
+            return False
+        with self._lock:
+            # under our own mode's key: a download keeps seeding as the torrent it came from
+            key = cache_key(st, self.piece_size, self.block_size)
+            self._entries[filepath] = {"key": key, "ih": ih, "meta": meta}
+        self.save()
+        return True
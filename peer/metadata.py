@@ -0,0 +1,147 @@
+import threading
+from typing import Dict, Any, List, Optional
+
+from common.constants import META_INLINE_BYTES, META_CHUNK_HASHES
+from common.utils import jencode, b64e, b64d
+from peer.meta_cache import meta_infohash
+from peer import merkle
+
+DIGEST_SIZE = 32  # sha256
+MAX_CHUNK_HASHES = 1500  # ~64KB of base64: what one META datagram can carry
+
+
+def is_compact(meta: Dict[str, Any]) -> bool:
+    return "piece_hashes" not in meta
+
+
+def chunk_span(pieces: int, tree: bool) -> int:
+    """
+    Hashes per metadata chunk. With a Merkle root, chunks are aligned power-of-two
+    subtrees of the piece-root tree, so each one can be proven on its own.
+    """
+    span = max(1, min(META_CHUNK_HASHES, MAX_CHUNK_HASHES))
+    if tree:
+        span = min(1 << (span.bit_length() - 1), merkle.next_pow2(pieces))
+    return span
+
+
+def announce_meta(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Metadata to put in OWN: the full meta while it is small, otherwise a compact one
+    with the piece count instead of the hash list (which peers hand out via GET_META).
+    A Merkle meta keeps its `root`, which is all a downloader needs to check the chunks.
+    """
+    if len(jencode(meta)) <= META_INLINE_BYTES:
+        return meta
+    hashes = meta["piece_hashes"]
+    span = chunk_span(len(hashes), "root" in meta)
+    out = {k: v for k, v in meta.items() if k != "piece_hashes"}
+    out["pieces"] = len(hashes)
+    out["chunk_span"] = span
+    out["meta_chunks"] = (len(hashes) + span - 1) // span
+    return out
+
+
+def expand_meta(compact: Dict[str, Any], piece_hashes: List[str]) -> Dict[str, Any]:
+    """Full meta (the one the infohash was computed over) from a compact one and its hash list."""
+    meta = {k: v for k, v in compact.items() if k not in ("pieces", "meta_chunks", "chunk_span")}
+    meta["piece_hashes"] = piece_hashes
+    return meta
+
+
+def meta_chunk(piece_hashes: List[str], chunk: int, span: int) -> Optional[str]:
+    """Chunk `chunk` of the hash list as base64 of the raw digests (half the size of hex in JSON)."""
+    if chunk < 0 or not 0 < span <= MAX_CHUNK_HASHES:
+        return None
+    part = piece_hashes[chunk * span:(chunk + 1) * span]
+    if not part:
+        return None
+    return b64e(b"".join(bytes.fromhex(h) for h in part))
+
+
+def piece_tree(piece_hashes: List[str]) -> List[List[bytes]]:
+    return merkle.layers([bytes.fromhex(h) for h in piece_hashes])
+
+
+def chunk_proof(tree: List[List[bytes]], chunk: int, span: int) -> Optional[List[str]]:
+    """Siblings that connect chunk `chunk` to the root, None if the chunk is not an aligned subtree."""
+    if span & (span - 1) or span > len(tree[0]):
+        return None
+    return [h.hex() for h in merkle.subtree_proof(tree, chunk, span)]
+
+
+class MetaAssembler:
+    """
+    Collects the hash-list chunks of one compact torrent (like BEP 9 metadata exchange).
+    - Merkle metas: every chunk comes with a proof against `root` and a bad one is
+      dropped on arrival, so only that chunk is fetched again
+    - flat metas: chunks cannot be checked one by one; the rebuilt meta is checked
+      against the infohash once all of them are in, and a mismatch starts over
+    The final check hashes the whole meta: add() only reports that every chunk is in,
+    the caller runs finish() off the receive path.
+    """
+
+    def __init__(self, ih: str, compact: Dict[str, Any]):
+        self.ih = ih
+        self.compact = compact
+        self.pieces = int(compact.get("pieces", 0))
+        self.chunks = int(compact.get("meta_chunks", 0))
+        self.span = int(compact.get("chunk_span", META_CHUNK_HASHES))
+        self.root = bytes.fromhex(compact["root"]) if compact.get("root") else None
+        self._lock = threading.Lock()
+        self._parts: Dict[int, List[str]] = {}
+        self.done = threading.Event()
+        self.meta: Optional[Dict[str, Any]] = None
+        self.failures = 0
+        self._checking = False  # every chunk is in, finish() is pending or running
+
+    def _expected(self, chunk: int) -> int:
+        return min(self.span, self.pieces - chunk * self.span)
+
+    def missing(self) -> List[int]:
+        with self._lock:
+            return [c for c in range(self.chunks) if c not in self._parts]
+
+    def add(self, chunk: int, data: str, proof: Optional[List[str]] = None) -> bool:
+        """
+        Called from the receive path; ignores malformed, unproven or unexpected chunks.
+        True once for the chunk that completes the set: the caller then runs finish().
+        """
+        if not 0 <= chunk < self.chunks or self.done.is_set():
+            return False
+        try:
+            raw = b64d(data)
+            siblings = [bytes.fromhex(h) for h in proof or []]
+        except Exception:
+            return False
+        if len(raw) != self._expected(chunk) * DIGEST_SIZE:
+            return False
+        digests = [raw[i:i + DIGEST_SIZE] for i in range(0, len(raw), DIGEST_SIZE)]
+        if self.root is not None:
+            if not merkle.verify_subtree(merkle.root(digests, self.span), chunk, siblings, self.root):
+                self.failures += 1
+                return False
+        with self._lock:
+            if self._checking:
+                return False
+            self._parts[chunk] = [d.hex() for d in digests]
+            if len(self._parts) < self.chunks:
+                return False
+            self._checking = True
+        return True
+
+    def finish(self) -> None:
+        """Rebuild the meta and check it against the infohash."""
+        with self._lock:
+            hashes = [h for c in range(self.chunks) for h in self._parts[c]]
+        meta = expand_meta(self.compact, hashes)
+        ok = meta_infohash(meta) == self.ih
+        with self._lock:
+            self._checking = False
+            if not ok:
+                # some peer sent garbage; we cannot tell which chunk, so fetch everything again
+                self._parts.clear()
+                self.failures += 1
+                return
+            self.meta = meta
+        self.done.set()
@@ -1,13 +1,17 @@
 import os
 import re
+import asyncio
 import json
 import time
+import queue
 import socket
 import threading
 import base64
 import hashlib
 import shutil
-from typing import Dict, Any, Tuple, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Tuple, Optional, List
 from functools import wraps
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
@@ -18,11 +22,20 @@ from common.constants import (
     ADVERTISE_HOST,
     NODE_PORT,
     BUFFER_SIZE,
+    SOCK_RCVBUF,
     PIECE_SIZE,
     BLOCK_SIZE,
+    HASH_MODE,
+    HASH_WORKERS,
     HEARTBEAT_SEC,
+    REGISTER_SYNC_BATCH,
+    NEED_BATCH,
     SEED_DIR,
     DOWNLOAD_DIR,
+    CACHE_DIR,
+    MMAP_CACHE_FILES,
+    LEAF_CACHE_PIECES,
+    META_CHUNK_HASHES,
     MODE_OWN,
     MODE_NEED,
     MODE_LIST,
@@ -31,8 +44,42 @@ from common.constants import (
     MODE_EXIT,
     T_GET_PIECE,
     T_PIECE_BLOCK,
+    T_GET_BLOCKS,
+    T_PIECE_ACK,
+    T_GET_BITFIELD,
+    T_BITFIELD,
+    T_HAVE,
+    T_CANCEL,
+    T_GET_META,
+    T_META,
+    T_PIECE_HASHES,
+    NACK_MAX_ROUNDS,
+    BITFIELD_WAIT_SEC,
+    PEER_REFRESH_SEC,
+    PEER_MAX_FAILURES,
+    DOWNLOAD_STALL_ROUNDS,
 )
-from common.utils import jencode, jdecode, sha256_hex, b64e, b64d
+from common.utils import jencode, jdecode, sha256_hex, b64e, b64d, ih_digest
+from common.protocol import (
+    ProtocolError,
+    BLOCK_WIRE_VERSION,
+    is_block_frame,
+    decode_block,
+    pack_bitfield,
+    unpack_bitfield,
+)
+from peer.seed_index import SeedIndex
+from peer.watcher import SeedWatcher
+from peer.meta_cache import MetaCache, meta_infohash
+from peer.tracker_client import TrackerClient
+from peer.tracker_cache import TrackerCache, PEERS
+from peer.metadata import MetaAssembler, announce_meta, is_compact, expand_meta, meta_chunk, piece_tree, chunk_proof
+from peer import merkle
+from peer.piece_server import MmapCache, piece_view, piece_frames
+from peer.pipeline import RequestWindow
+from peer.congestion import Pacers
+from peer.picker import PiecePicker
+from peer.dataplane import DataPlane, Signal
 
 
 class Node:
@@ -42,17 +89,65 @@ class Node:
         self.download_dir = DOWNLOAD_DIR
 
         self.tracker = (TRACKER_HOST, TRACKER_PORT)
+        # NEED/LIST/FIND/REGISTER: one socket, replies matched by request id, retried on loss
+        self.tracker_client = TrackerClient(self.tracker, self._log)
+        # NEED / FIND_BY_NAME replies for a few seconds (NOT_FOUND too), so polling stays local
+        self.tracker_cache = TrackerCache()
 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # a whole piece arrives as one burst of blocks; the default ~200KB buffer drops most of it
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_RCVBUF)
         self.sock.bind(("0.0.0.0", NODE_PORT))
-        self.sock.settimeout(0.5)
+        # datagrams, piece serving and download workers all run on one asyncio loop thread
+        self.plane = DataPlane(self.sock, self._on_datagram, self._log)
 
         # download sessions: infohash -> state dict
         self.dl_lock = threading.Lock()
         self.downloads: Dict[str, Dict[str, Any]] = {}
+        # assembled pieces are verified + written here, off the receive thread
+        self.piece_pool = ThreadPoolExecutor(max_workers=max(2, HASH_WORKERS), thread_name_prefix="piece")
 
         # keep track of seeded torrents so tracker TTL won't drop them (optional but useful)
         self.seeding = set()
+        # infohash -> last OWN we sent for it; the keepalive digest covers these, and a resync
+        # sends them again for whatever the tracker lost (own lock: OWN/EXIT also go out under dl_lock)
+        self.announce_lock = threading.Lock()
+        self.announced: Dict[str, Dict[str, Any]] = {}
+
+        # infohash -> hash-list chunks being fetched for a compact-announced torrent
+        self.meta_fetches: Dict[str, MetaAssembler] = {}
+
+        # tracker catalogue as of the last sync poll; later polls only fetch the changes
+        self.catalog: Dict[str, Any] = {"epoch": None, "version": 0, "items": {}}
+
+        # (path, dev, inode, size, mtime) -> meta, so unchanged files are hashed once
+        self.cache_dir = os.path.join("/app", CACHE_DIR)
+        self.meta_cache = MetaCache(
+            os.path.join(self.cache_dir, "meta_cache.json"),
+            PIECE_SIZE,
+            self._log,
+            block_size=BLOCK_SIZE if HASH_MODE == "merkle" else 0,
+        )
+
+        # infohash -> seed file, so GET_PIECE does not rehash the seed dir
+        self.seed_index = SeedIndex(
+            os.path.join("/app", self.seed_dir),
+            os.path.join(self.cache_dir, "seed_index.json"),
+            self._build_meta,
+            self.meta_cache.peek,
+            self._log,
+        )
+        # seed dir change feed: only new/changed files get hashed and announced, by _seed_worker
+        self.seed_events: "queue.Queue[Tuple[str, bool]]" = queue.Queue()
+        self.watcher = SeedWatcher(os.path.join("/app", self.seed_dir), self.seed_events, self._log)
+        self.mmaps = MmapCache(MMAP_CACHE_FILES)
+        # per-destination sender congestion control (only for peers that send PIECE_ACK)
+        self.pacers = Pacers()
+        # endgame CANCELs received: (addr, ih, piece) -> time
+        self.cancels: Dict[Tuple[Tuple[str, int], str, int], float] = {}
+        # Merkle torrents (loop thread only): (ih, piece) -> leaf layer we serve, ih -> piece-root tree
+        self.leaf_cache: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self.meta_trees: "OrderedDict[str, List[List[bytes]]]" = OrderedDict()
 
         # User authentication storage
         self.users_file = os.path.join("/app", "users.json")
@@ -62,8 +157,10 @@ class Node:
         self._log(f"bind=0.0.0.0:{NODE_PORT} advertise={ADVERTISE_HOST}:{NODE_PORT}")
         self._log(f"tracker={TRACKER_HOST}:{TRACKER_PORT} piece_size={PIECE_SIZE} block_size={BLOCK_SIZE}")
 
-        threading.Thread(target=self._recv_loop, daemon=True).start()
+        self.plane.start()
         threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+        self.watcher.start()
+        threading.Thread(target=self._seed_worker, daemon=True).start()
         threading.Thread(target=self._sync_node_files_loop, daemon=True).start()
 
     def _log(self, msg: str) -> None:
@@ -125,7 +222,7 @@ class Node:
         if msg_size > BUFFER_SIZE:
             self._log(f"WARNING: Message size {msg_size} exceeds BUFFER_SIZE {BUFFER_SIZE}, may fail")
         try:
-            self.sock.sendto(encoded, self.tracker)
+            self.plane.sendto(encoded, self.tracker)
         except OSError as e:
             if e.errno == 90:  # Message too long
                 self._log(f"ERROR: Message too long ({msg_size} bytes) to send to tracker. File metadata too large.")
@@ -133,54 +230,169 @@ class Node:
             raise
 
     def _tracker_call(self, req: Dict[str, Any]) -> Dict[str, Any]:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.settimeout(3.0)
-        s.sendto(jencode(req), self.tracker)
-        data, _ = s.recvfrom(BUFFER_SIZE)
-        s.close()
-        return jdecode(data)
+        return self.tracker_client.call(req)
+
+    def _tracker_cached(self, mode: str, key: str, req: Dict[str, Any]) -> Dict[str, Any]:
+        resp = self.tracker_cache.get(mode, key)
+        if resp is None:
+            resp = self._tracker_call(req)
+            self.tracker_cache.put(mode, key, resp)
+        return resp
 
     def _tracker_need(self, infohash: str) -> Dict[str, Any]:
-        return self._tracker_call({"mode": MODE_NEED, "node_id": self.node_id, "infohash": infohash})
+        return self._tracker_cached(MODE_NEED, infohash,
+                                    {"mode": MODE_NEED, "node_id": self.node_id, "infohash": infohash})
 
-    def _tracker_list(self) -> Dict[str, Any]:
-        return self._tracker_call({"mode": MODE_LIST, "node_id": self.node_id})
+    def _tracker_need_many(self, infohashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Peers and filename of many swarms: cached ones first, the rest in batched NEEDs,
+        all in flight together, and again for whatever did not fit in the replies.
+        Unknown or unanswered swarms are left out.
+        """
+        out: Dict[str, Dict[str, Any]] = {}
+        todo = []
+        for ih in infohashes:
+            hit = self.tracker_cache.get(PEERS, ih) or self.tracker_cache.get(MODE_NEED, ih)
+            if hit is None:
+                todo.append(ih)
+            elif hit.get("ok"):
+                out[ih] = hit if "meta" not in hit else {"filename": hit["meta"].get("filename"), "peers": hit.get("peers", [])}
+        while todo:
+            reqs = [{"mode": MODE_NEED, "node_id": self.node_id, "infohashes": todo[i:i + NEED_BATCH]}
+                    for i in range(0, len(todo), NEED_BATCH)]
+            todo = []
+            for resp in self.tracker_client.call_many(reqs):
+                if not resp or not resp.get("ok"):
+                    continue
+                for ih, found in resp.get("swarms", {}).items():
+                    out[ih] = found
+                    self.tracker_cache.put(PEERS, ih, dict(found, ok=True))
+                for ih in resp.get("missing", []):
+                    self.tracker_cache.put(PEERS, ih, {"ok": False, "error": "NOT_FOUND"})
+                todo.extend(resp.get("rest", []))
+        return out
+
+    def _tracker_list(self, cursor: Optional[str] = None, since: Optional[int] = None,
+                      epoch: Optional[str] = None) -> Dict[str, Any]:
+        """One LIST page: from `cursor` on, or the changes after version `since` of tracker run `epoch`."""
+        req = {"mode": MODE_LIST, "node_id": self.node_id}
+        if cursor:
+            req["cursor"] = cursor
+        if since is not None:
+            req.update(since=since, epoch=epoch)
+        return self._tracker_call(req)
+
+    def _refresh_catalog(self) -> bool:
+        """
+        Bring self.catalog up to date: just the changes since the last poll, or the whole
+        catalogue page by page on the first poll and after the tracker restarted or
+        dropped our version from its change log. False if the tracker refused.
+        """
+        cat = self.catalog
+        if cat["epoch"] is not None:
+            while True:
+                resp = self._tracker_list(since=cat["version"], epoch=cat["epoch"])
+                if not resp.get("ok"):
+                    return False
+                if resp.get("reset"):
+                    break
+                for ih in resp.get("removed", []):
+                    cat["items"].pop(ih, None)
+                for item in resp.get("items", []):
+                    cat["items"][item["infohash"]] = item
+                cat["version"] = resp["version"]
+                if not resp.get("more"):
+                    return True
+        items: Dict[str, Dict[str, Any]] = {}
+        first: Optional[Dict[str, Any]] = None
+        cursor = None
+        while True:
+            resp = self._tracker_list(cursor=cursor)
+            if not resp.get("ok"):
+                return False
+            # anything that changes while we page through shows up in the next poll after this version
+            first = first or resp
+            for item in resp.get("items", []):
+                items[item["infohash"]] = item
+            cursor = resp.get("next")
+            if not cursor:
+                break
+        cat.update(epoch=first.get("epoch"), version=first.get("version", 0), items=items)
+        return True
 
     def _tracker_find_by_name(self, filename: str) -> Dict[str, Any]:
-        return self._tracker_call({"mode": MODE_FIND_BY_NAME, "node_id": self.node_id, "filename": filename})
+        return self._tracker_cached(MODE_FIND_BY_NAME, filename,
+                                    {"mode": MODE_FIND_BY_NAME, "node_id": self.node_id, "filename": filename})
+
+    def _track_announce(self, ih: str, msg: Optional[Dict[str, Any]]) -> None:
+        """Remember the OWN we sent for `ih` (None: we sent EXIT) and drop the cached replies it made stale."""
+        with self.announce_lock:
+            old = self.announced.pop(ih, None)
+            if msg is not None:
+                self.announced[ih] = msg
+        self.tracker_cache.invalidate(ih, (msg or old or {}).get("meta", {}).get("filename"))
 
     def _heartbeat_loop(self) -> None:
         """
-        Heartbeat/REGISTER for both:
-        - active downloads
-        - active seeding torrents
-        This prevents tracker TTL from dropping owners.
+        One node-level REGISTER per interval, however many swarms we seed or download:
+        it keeps all our owner entries alive at the tracker and carries the count and
+        digest of the infohashes we announced, so a tracker that lost some of them
+        (restart, expiry while we were unreachable) asks for a resync.
         """
         while True:
             time.sleep(HEARTBEAT_SEC)
-            with self.dl_lock:
-                active = set(self.downloads.keys()) | set(self.seeding)
-            for ih in active:
-                self._send_tracker({"mode": MODE_REGISTER, "node_id": self.node_id, "infohash": ih})
+            with self.announce_lock:
+                owned = sorted(self.announced)
+            try:
+                resp = self._tracker_call({
+                    "mode": MODE_REGISTER,
+                    "node_id": self.node_id,
+                    "owned": len(owned),
+                    "digest": ih_digest(owned),
+                })
+                if resp.get("resync"):
+                    self._resync_tracker(owned)
+            except (OSError, ValueError) as e:
+                self._log(f"REGISTER failed: {e}")
+
+    def _resync_tracker(self, owned: List[str]) -> None:
+        """
+        Batched REGISTER of everything we announced, in sorted slices that each cover the
+        infohash range (lo, hi]; the tracker drops owners we no longer claim in that range
+        and names the ones it does not know, which we OWN again.
+        """
+        reqs = []
+        lo = None
+        for i in range(0, max(1, len(owned)), REGISTER_SYNC_BATCH):
+            part = owned[i:i + REGISTER_SYNC_BATCH]
+            hi = part[-1] if i + REGISTER_SYNC_BATCH < len(owned) else None
+            reqs.append({"mode": MODE_REGISTER, "node_id": self.node_id, "infohashes": part, "lo": lo, "hi": hi})
+            lo = hi
+        # the slices are independent ranges: all in flight at once
+        missing = [ih for resp in self.tracker_client.call_many(reqs) if resp for ih in resp.get("missing", [])]
+        with self.announce_lock:
+            msgs = [self.announced[ih] for ih in missing if ih in self.announced]
+        for msg in msgs:
+            self._send_tracker(msg)
+            self.tracker_cache.invalidate(msg["infohash"], msg["meta"].get("filename"))
+        self._log(f"REGISTER resync: {len(owned)} owned, {len(msgs)} re-announced")
 
     # ---------------- Meta / Own ----------------
     def _build_meta(self, filepath: str) -> Tuple[str, Dict[str, Any]]:
-        size = os.path.getsize(filepath)
-        piece_hashes = []
-        with open(filepath, "rb") as fp:
-            while True:
-                piece = fp.read(PIECE_SIZE)
-                if not piece:
-                    break
-                piece_hashes.append(sha256_hex(piece))
-        meta = {
-            "filename": os.path.basename(filepath),
-            "size": size,
-            "piece_size": PIECE_SIZE,
-            "piece_hashes": piece_hashes,
-        }
-        infohash = sha256_hex(json.dumps(meta, sort_keys=True).encode("utf-8"))
-        return infohash, meta
+        """Cached: only hashes the file when its (dev, inode, size, mtime) changed."""
+        return self.meta_cache.get(filepath, progress=self._hash_progress(os.path.basename(filepath)))
+
+    def _hash_progress(self, filename: str):
+        step = {"next": 25}
+
+        def cb(done: int, total: int) -> None:
+            if total < 64:  # < 16MB with default pieces, not worth logging
+                return
+            pct = done * 100 // total
+            if pct >= step["next"]:
+                self._log(f"hashing {filename}: {pct}% ({done}/{total} pieces)")
+                step["next"] = pct - pct % 25 + 25
+        return cb
 
     def own_file(self, filename: str) -> bool:
         path = os.path.join("/app", self.seed_dir, filename)
@@ -196,16 +408,13 @@ class Node:
                 "host": ADVERTISE_HOST,
                 "port": NODE_PORT,
                 "infohash": ih,
-                "meta": meta,
+                # large files go out compact; downloaders fetch the hash list from the peers
+                "meta": announce_meta(meta),
             }
-            # Check message size before sending
-            encoded = jencode(msg)
-            if len(encoded) > BUFFER_SIZE:
-                self._log(f"OWN skipped: {filename} metadata too large ({len(encoded)} bytes, max {BUFFER_SIZE}). File has {len(meta['piece_hashes'])} pieces.")
-                return False
-            
             self._send_tracker(msg)
+            self._track_announce(ih, msg)
             self.seeding.add(ih)
+            self.seed_index.add(path, ih, meta)
             self._log(f"OWN announced: {filename} ih={ih[:10]}.. size={meta['size']} pieces={len(meta['piece_hashes'])}")
             return True
         except OSError as e:
@@ -235,6 +444,8 @@ class Node:
             "size": st.get("size"),
             "piece_size": st.get("piece_size"),
             "piece_hashes": st.get("piece_hashes"),
+            "block_size": st.get("block_size", 0),
+            "root": st.get("root"),
             "completed": st.get("completed"),
             "done": st.get("done"),
             "total_pieces": st.get("total_pieces"),
@@ -273,191 +484,660 @@ class Node:
         out = os.path.join("/app", target_dir, st["filename"])
         with open(st["part_path"], "rb+") as fp:
             fp.truncate(st["size"])
+        # every piece was verified on the way in -> seed without rehashing.
+        # Primed (and, in seed_dir, claimed) before the rename: the watcher may report `out`
+        # to _seed_worker right away, which must neither rehash it nor announce it again
+        meta = {
+            "filename": st["filename"],
+            "size": st["size"],
+            "piece_size": st["piece_size"],
+            "piece_hashes": st["piece_hashes"],
+        }
+        if st.get("root"):
+            meta.update(block_size=st["block_size"], root=st["root"])
+        self.meta_cache.prime(out, st["infohash"], meta, os.stat(st["part_path"]))
+        if target_dir == self.seed_dir:
+            self.seeding.add(st["infohash"])  # the caller's own_file() announces it
         os.replace(st["part_path"], out)
+        st["finished"] = True  # stop partial seeding from the (now renamed) .part file
         try:
             os.remove(st["resume_path"])
         except Exception:
             pass
         self._log(f"DOWNLOAD COMPLETE: {st['filename']} saved to {out}")
+        if target_dir != self.seed_dir and st["infohash"] not in self.seeding:
+            # we announced ourselves as partial owner; files outside seed_dir are not seeded
+            self._track_announce(st["infohash"], None)
+            self._send_tracker({"mode": MODE_EXIT, "node_id": self.node_id, "infohash": st["infohash"]})
 
     # ---------------- Peer transfer (UDP blocks) ----------------
     def _send_peer(self, msg: Dict[str, Any], addr: Tuple[str, int]) -> None:
-        self.sock.sendto(jencode(msg), addr)
+        self.plane.sendto(jencode(msg), addr)
 
     def _find_seed_file_by_infohash(self, ih: str) -> Optional[Tuple[str, Dict[str, Any]]]:
         """
-        Demo implementation: scan seed_dir to find file whose meta infohash matches.
+        O(1) lookup through the persistent seed index.
+        Unknown infohashes trigger a (rate-limited) rescan that only hashes new/changed files.
         """
-        seed_root = os.path.join("/app", self.seed_dir)
-        if not os.path.exists(seed_root):
-            return None
+        return self.seed_index.find(ih)
 
-        for fn in os.listdir(seed_root):
-            fp = os.path.join(seed_root, fn)
-            if not os.path.isfile(fp):
-                continue
-            try:
-                ih2, meta = self._build_meta(fp)
-            except Exception:
-                continue
-            if ih2 == ih:
-                return fp, meta
-        return None
+    async def _seed_lookup(self, ih: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """_find_seed_file_by_infohash for the loop thread: the stat and any rescan run on a worker thread."""
+        return await self.plane.loop.run_in_executor(None, self._seed_lookup_sync, ih)
 
-    def _serve_piece(self, ih: str, idx: int, addr: Tuple[str, int]) -> None:
-        found = self._find_seed_file_by_infohash(ih)
-        if not found:
-            return
-        fp, meta = found
+    def _seed_lookup_sync(self, ih: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        found = self.seed_index.lookup(ih)
+        if found is not None:
+            return found
+        with self.dl_lock:
+            st = self.downloads.get(ih)
+            if st and not st.get("finished"):
+                # our own unfinished download: not in the seed dir yet, a rescan would not find it
+                return None
+        return self._find_seed_file_by_infohash(ih)
+
+    def _piece_source(self, ih: str, idx: int) -> Optional[Tuple[memoryview, int, int]]:
+        """(file view, piece_size, block_size) to serve piece `idx` from; stats and maps, so not on the loop."""
+        found = self._seed_lookup_sync(ih)
+        if found:
+            fp, meta = found
+            view = self.mmaps.view(fp)
+            piece_size = meta["piece_size"]
+            block_size = meta.get("block_size", 0)
+        else:
+            # partial seeding: verified pieces of an in-progress download, read from the .part file
+            with self.dl_lock:
+                st = self.downloads.get(ih)
+                if not st or st.get("finished") or not 0 <= idx < st["total_pieces"] or not st["completed"][idx]:
+                    return None
+                fp, piece_size, block_size = st["part_path"], st["piece_size"], st.get("block_size", 0)
+            # .part mtime changes with every written piece; its size and inode do not
+            view = self.mmaps.view(fp, track_mtime=False)
+        return (view, piece_size, block_size) if view is not None else None
+
+    async def _serve_piece(
+        self,
+        ih: str,
+        idx: int,
+        addr: Tuple[str, int],
+        wire: int = 0,
+        only: Optional[List[int]] = None,
+        cc: bool = False,
+        leaves: bool = False,
+    ) -> None:
+        source = await self.plane.loop.run_in_executor(None, self._piece_source, ih, idx)
 
         # optional server-side log
         # self._log(f"serve piece {idx} to {addr[0]}:{addr[1]}")
 
-        with open(fp, "rb") as f:
-            f.seek(idx * meta["piece_size"])
-            piece = f.read(meta["piece_size"])
-
-        total_blocks = (len(piece) + BLOCK_SIZE - 1) // BLOCK_SIZE if piece else 0
-        for b in range(total_blocks):
-            blk = piece[b * BLOCK_SIZE : (b + 1) * BLOCK_SIZE]
-            self._send_peer(
-                {
-                    "type": T_PIECE_BLOCK,
-                    "ih": ih,
-                    "piece": idx,
-                    "block": b,
-                    "total_blocks": total_blocks,
-                    "data": b64e(blk),
-                },
-                addr,
-            )
+        if source is None:
+            return
+        view, piece_size, block_size = source
+        piece = piece_view(view, idx, piece_size)
+        # legacy downloaders never ACK, so they cannot drive the controller -> unpaced as before
+        pacer = self.pacers.get(addr) if cc else None
+        ckey = (addr, ih, idx)
+        self.cancels.pop(ckey, None)  # a new request overrides an older CANCEL
+        try:
+            if leaves and block_size == BLOCK_SIZE:
+                # leaves line up with our blocks: the downloader can check each one as it lands
+                layer = await self._piece_leaves(ih, idx, piece)
+                self._send_peer({"type": T_PIECE_HASHES, "ih": ih, "piece": idx, "leaves": b64e(layer)}, addr)
+            for nbytes, parts in piece_frames(ih, idx, piece, BLOCK_SIZE, wire >= BLOCK_WIRE_VERSION, only):
+                if ckey in self.cancels:
+                    break
+                if pacer:
+                    delay = pacer.reserve(nbytes)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if not self.plane.writable.is_set():
+                    await self.plane.writable.wait()
+                self.plane.send_parts(parts, addr)
+            if pacer:
+                pacer.on_piece_sent(ih, idx)
+        finally:
+            self.cancels.pop(ckey, None)
+            piece.release()
+            view.release()
+
+    async def _piece_leaves(self, ih: str, idx: int, piece) -> bytes:
+        key = (ih, idx)
+        layer = self.leaf_cache.get(key)
+        if layer is not None:
+            self.leaf_cache.move_to_end(key)
+            return layer
+        layer = b"".join(await self.plane.loop.run_in_executor(None, merkle.block_leaves, piece, BLOCK_SIZE))
+        self.leaf_cache[key] = layer
+        if len(self.leaf_cache) > LEAF_CACHE_PIECES:
+            self.leaf_cache.popitem(last=False)
+        return layer
+
+    def _on_cancel(self, addr: Tuple[str, int], ih: str, idx: int) -> None:
+        now = time.time()
+        self.cancels[(addr, ih, idx)] = now
+        if len(self.cancels) > 4096:
+            for k in [k for k, t in list(self.cancels.items()) if now - t > 10]:
+                self.cancels.pop(k, None)
+
+    async def _reply_bitfield(self, ih: str, addr: Tuple[str, int]) -> None:
+        if await self._seed_lookup(ih):
+            self._send_peer({"type": T_BITFIELD, "ih": ih, "node_id": self.node_id, "seed": True}, addr)
+            return
+        with self.dl_lock:
+            st = self.downloads.get(ih)
+            if not st or st.get("finished"):
+                return
+            # remember who is interested so they get our HAVEs
+            st.setdefault("interested", set()).add(addr)
+            reply = {"type": T_BITFIELD, "ih": ih, "node_id": self.node_id, "bits": pack_bitfield(st["completed"])}
+        self._send_peer(reply, addr)
+
+    async def _reply_meta(self, ih: str, chunk: int, span: int, addr: Tuple[str, int]) -> None:
+        found = await self._seed_lookup(ih)
+        if found:
+            hashes, root = found[1]["piece_hashes"], found[1].get("root")
+        else:
+            # a downloader has the full list as soon as its own fetch completed
+            with self.dl_lock:
+                st = self.downloads.get(ih)
+                hashes, root = (st.get("piece_hashes"), st.get("root")) if st else (None, None)
+            if not hashes:
+                return
+        data = meta_chunk(hashes, chunk, span)
+        if data is None:
+            return
+        reply = {"type": T_META, "ih": ih, "chunk": chunk, "hashes": data}
+        if root:
+            tree = self.meta_trees.get(ih)
+            if tree is None:
+                tree = await self.plane.loop.run_in_executor(None, piece_tree, hashes)
+                self.meta_trees[ih] = tree
+                if len(self.meta_trees) > 8:
+                    self.meta_trees.popitem(last=False)
+            reply["proof"] = chunk_proof(tree, chunk, span)
+            if reply["proof"] is None:
+                return
+        self._send_peer(reply, addr)
+
+    def _announce_partial(self, ih: str, meta: Dict[str, Any]) -> None:
+        """Announce an in-progress download as (partial) owner so other downloaders can use our pieces."""
+        msg = {
+            "mode": MODE_OWN,
+            "node_id": self.node_id,
+            "host": ADVERTISE_HOST,
+            "port": NODE_PORT,
+            "infohash": ih,
+            "meta": announce_meta(meta),
+            "partial": True,
+        }
+        try:
+            self._send_tracker(msg)
+        except OSError as e:
+            self._log(f"partial OWN failed ih={ih[:10]}..: {e}")
+            return
+        self._track_announce(ih, msg)
 
-    def _recv_loop(self) -> None:
-        while True:
+    def _broadcast_have(self, st: Dict[str, Any], idx: int) -> None:
+        with self.dl_lock:
+            targets = {(p["host"], int(p["port"])) for p in st.get("active_peers", []) if p.get("node_id") != self.node_id}
+            targets |= st.get("interested", set())
+        msg = {"type": T_HAVE, "ih": st["infohash"], "piece": idx, "node_id": self.node_id}
+        for addr in targets:
             try:
-                data, addr = self.sock.recvfrom(BUFFER_SIZE)
-            except socket.timeout:
-                continue
-            except Exception:
-                continue
+                self._send_peer(msg, addr)
+            except OSError:
+                pass
 
+    def _on_block(self, ih: str, p: int, b: int, tb: int, chunk, addr: Tuple[str, int]) -> None:
+        if p < 0 or b < 0 or tb <= 0 or b >= tb:
+            return
+        st = self.downloads.get(ih)
+        leaves = st["leaves"].get(p) if st and "leaves" in st else None
+        checked = False
+        if leaves is not None:
+            if len(leaves) != tb:
+                # the proven leaf layer fixes the block count: a block claiming another one is bogus
+                return
+            if hashlib.sha256(chunk).digest() != leaves[b]:
+                # treated like a lost block: the worker's NACK round re-requests just this one
+                self._log(f"piece {p} block {b} from {addr[0]}:{addr[1]} failed its Merkle check -> dropped")
+                return
+            checked = True
+        with self.dl_lock:
+            st = self.downloads.get(ih)
+            if not st or p >= st["total_pieces"] or st["completed"][p] == 1:
+                return
+            buf = st["buffers"].get(p)
+            if buf is None or buf["total"] != tb:
+                # first block, or the sender re-split the piece: what we have does not line up any more
+                buf = st["buffers"][p] = {"total": tb, "blocks": {}}
+            buf["blocks"][b] = chunk
+            if checked:
+                buf.setdefault("checked", set()).add(b)
+            else:
+                buf.get("checked", set()).discard(b)
+            if len(buf["blocks"]) != tb:
+                return
+            # piece assembled: hand it to the pool right away and resolve the waiting workers' futures
+            st["buffers"].pop(p, None)
+            waiters = st["waiters"].pop(p, [])
+        self._send_peer({"type": T_PIECE_ACK, "ih": ih, "piece": p}, addr)
+        if len(waiters) > 1:
+            # endgame duplicate: tell the other peers to stop sending this piece
+            for _, peer in waiters:
+                self._send_peer({"type": T_CANCEL, "ih": ih, "piece": p}, (peer["host"], int(peer["port"])))
+        done = self.plane.loop.run_in_executor(self.piece_pool, self._verify_and_write, ih, p, buf, waiters)
+        done.add_done_callback(lambda f: self._resolve_waiters(waiters, f))
+
+    def _on_piece_hashes(self, msg: Dict[str, Any]) -> None:
+        """Leaf layer of a piece we asked for; kept only if it hashes up to the piece root in the meta."""
+        st = self.downloads.get(msg.get("ih") or "")
+        p = int(msg.get("piece", -1))
+        if not st or not st.get("block_size") or "leaves" not in st:
+            return
+        if not 0 <= p < st["total_pieces"] or st["completed"][p] or p in st["leaves"]:
+            return
+        try:
+            raw = b64d(msg.get("leaves") or "")
+        except Exception:
+            return
+        if not raw or len(raw) % 32:
+            return
+        leaves = [raw[i:i + 32] for i in range(0, len(raw), 32)]
+        if merkle.root(leaves).hex() == st["piece_hashes"][p]:
+            st["leaves"][p] = leaves
+
+    @staticmethod
+    def _resolve_waiters(waiters: List[Tuple[asyncio.Future, Dict[str, Any]]], done: asyncio.Future) -> None:
+        ok = not done.cancelled() and done.exception() is None and bool(done.result())
+        for fut, _ in waiters:
+            if not fut.done():
+                fut.set_result(ok)
+
+    def _on_datagram(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """DataPlane callback, runs on the loop thread: anything that may block is handed to a task or the pool."""
+        if is_block_frame(data):
             try:
-                msg = jdecode(data)
-            except Exception:
-                continue
+                f = decode_block(data)
+            except ProtocolError:
+                return
+            # payload stays a memoryview into `data` until the piece is joined
+            self._on_block(f.infohash, f.piece, f.block, f.total_blocks, f.payload, addr)
+            return
 
-            t = msg.get("type")
-            if t == T_GET_PIECE:
-                ih = msg.get("ih")
-                idx = int(msg.get("piece", -1))
-                if not ih or idx < 0:
-                    continue
-                threading.Thread(target=self._serve_piece, args=(ih, idx, addr), daemon=True).start()
-                continue
+        try:
+            msg = jdecode(data)
+        except Exception:
+            return
 
-            if t == T_PIECE_BLOCK:
-                ih = msg.get("ih")
-                if not ih:
-                    continue
-                p = int(msg.get("piece", -1))
-                b = int(msg.get("block", -1))
-                tb = int(msg.get("total_blocks", 0))
-                if p < 0 or b < 0 or tb <= 0:
-                    continue
-                try:
-                    chunk = b64d(msg.get("data", ""))
-                except Exception:
-                    continue
+        t = msg.get("type")
+        if t == T_GET_PIECE:
+            ih = msg.get("ih")
+            idx = int(msg.get("piece", -1))
+            if not ih or idx < 0:
+                return
+            wire = int(msg.get("wire", 0) or 0)
+            cc = bool(msg.get("cc"))
+            self.plane.serve(self._serve_piece, ih, idx, addr, wire, None, cc, bool(msg.get("leaves")))
+            return
 
-                with self.dl_lock:
-                    st = self.downloads.get(ih)
-                    if not st:
-                        continue
-                    buf = st["buffers"].setdefault(p, {"total": tb, "blocks": {}})
-                    buf["total"] = tb
-                    buf["blocks"][b] = chunk
+        if t == T_GET_BLOCKS:
+            ih = msg.get("ih")
+            idx = int(msg.get("piece", -1))
+            try:
+                only = [int(b) for b in msg.get("blocks") or []]
+            except (TypeError, ValueError):
+                return
+            if not ih or idx < 0 or not only:
+                return
+            wire = int(msg.get("wire", 0) or 0)
+            cc = bool(msg.get("cc"))
+            if cc:
+                # a NACK means blocks we paced out were dropped on the way
+                self.pacers.get(addr).on_loss()
+            self.plane.serve(self._serve_piece, ih, idx, addr, wire, only, cc, bool(msg.get("leaves")))
+            return
 
-    def _piece_worker(self, ih: str, peer: Dict[str, Any], q) -> None:
-        """
-        Worker pinned to a single peer.
-        Critical fix:
-        - if a piece times out or hash mismatch -> re-queue the piece (do not lose it)
-        """
-        import queue as _q
+        if t == T_GET_BITFIELD:
+            if msg.get("ih"):
+                self.plane.spawn(self._reply_bitfield(msg["ih"], addr))
+            return
 
-        addr = (peer["host"], int(peer["port"]))
+        if t == T_BITFIELD:
+            self._on_bitfield(msg)
+            return
 
-        while True:
-            try:
-                idx = q.get_nowait()
-            except _q.Empty:
-                return
+        if t == T_GET_META:
+            if msg.get("ih"):
+                span = int(msg.get("span") or META_CHUNK_HASHES)
+                self.plane.spawn(self._reply_meta(msg["ih"], int(msg.get("chunk", -1)), span, addr))
+            return
 
-            success = False
+        if t == T_META:
+            asm = self.meta_fetches.get(msg.get("ih") or "")
+            if asm and asm.add(int(msg.get("chunk", -1)), msg.get("hashes") or "", msg.get("proof")):
+                # last chunk: the infohash check hashes the whole meta, not on the loop
+                self.piece_pool.submit(asm.finish)
+            return
+
+        if t == T_PIECE_HASHES:
+            self._on_piece_hashes(msg)
+            return
 
+        if t == T_HAVE:
             with self.dl_lock:
-                st = self.downloads[ih]
-                if st["completed"][idx] == 1:
-                    q.task_done()
-                    continue
-                st["buffers"].pop(idx, None)
+                st = self.downloads.get(msg.get("ih") or "")
+                picker = st.get("picker") if st else None
+            if picker:
+                picker.have(str(msg.get("node_id")), int(msg.get("piece", -1)))
+            return
+
+        if t == T_CANCEL:
+            if msg.get("ih"):
+                self._on_cancel(addr, msg["ih"], int(msg.get("piece", -1)))
+            return
 
-            # log request
-            self._log(
-                f"request piece {idx} from node {peer.get('node_id','?')} @ {peer['host']}:{peer['port']}"
+        if t == T_PIECE_ACK:
+            pacer = self.pacers.peek(addr)
+            if pacer and msg.get("ih"):
+                pacer.on_ack(msg["ih"], int(msg.get("piece", -1)))
+            return
+
+        if t == T_PIECE_BLOCK:
+            ih = msg.get("ih")
+            if not ih:
+                return
+            try:
+                chunk = b64d(msg.get("data", ""))
+            except Exception:
+                return
+            self._on_block(
+                ih, int(msg.get("piece", -1)), int(msg.get("block", -1)), int(msg.get("total_blocks", 0)), chunk,
+                addr,
             )
 
-            # request piece
-            self._send_peer({"type": T_GET_PIECE, "ih": ih, "piece": idx}, addr)
+    def _on_bitfield(self, msg: Dict[str, Any]) -> None:
+        with self.dl_lock:
+            st = self.downloads.get(msg.get("ih") or "")
+            picker = st.get("picker") if st else None
+        if not picker:
+            return
+        key = str(msg.get("node_id"))
+        if msg.get("seed"):
+            picker.add_peer(key, None)
+            return
+        try:
+            picker.add_peer(key, unpack_bitfield(msg.get("bits") or "", picker.total))
+        except ProtocolError:
+            pass
 
-            deadline = time.time() + 5.0
-            while time.time() < deadline:
-                time.sleep(0.05)
+    @staticmethod
+    def _peer_key(peer: Dict[str, Any]) -> str:
+        return str(peer.get("node_id", f"{peer['host']}:{peer['port']}"))
 
-                with self.dl_lock:
-                    st = self.downloads[ih]
-                    buf = st["buffers"].get(idx)
-                    if not buf:
-                        continue
-                    if len(buf["blocks"]) != buf["total"]:
-                        continue
+    async def _exchange_bitfields(
+        self, ih: str, peers: List[Dict[str, Any]], picker: PiecePicker, signal: Signal
+    ) -> None:
+        """
+        Ask every peer which pieces it has. Peers that do not answer within
+        BITFIELD_WAIT_SEC (older nodes) are assumed to be full seeds, as before.
+        """
+        for peer in peers:
+            self._send_peer({"type": T_GET_BITFIELD, "ih": ih, "node_id": self.node_id}, (peer["host"], int(peer["port"])))
+        loop = self.plane.loop
+        deadline = loop.time() + BITFIELD_WAIT_SEC
+        keys = {self._peer_key(p) for p in peers}
+        while loop.time() < deadline and not keys <= picker.known_peers():
+            await signal.wait(max(0.0, deadline - loop.time()))
+        for key in keys - picker.known_peers():
+            picker.add_peer(key, None)
+
+    def _start_peer_workers(
+        self, ih: str, st: Dict[str, Any], peers: List[Dict[str, Any]], picker: PiecePicker
+    ) -> None:
+        """Bitfield exchange + one worker task for every peer we are not already downloading from."""
+        with self.dl_lock:
+            started = st.setdefault("peer_keys", set())
+            new = [p for p in peers if p.get("node_id") != self.node_id and self._peer_key(p) not in started]
+            started.update(self._peer_key(p) for p in new)
+            known = {self._peer_key(p) for p in st.get("active_peers", [])}
+            st["active_peers"] = st.get("active_peers", []) + [p for p in new if self._peer_key(p) not in known]
+        if not new:
+            return
+        # blocks the calling (download) thread until the exchange is done, the workers keep running on the loop
+        self.plane.submit(self._spawn_peer_workers(ih, st, new, picker)).result()
 
-                    blocks = buf["blocks"]
-                    try:
-                        data = b"".join(blocks[i] for i in range(buf["total"]))
-                    except KeyError:
-                        continue
+    async def _spawn_peer_workers(
+        self, ih: str, st: Dict[str, Any], peers: List[Dict[str, Any]], picker: PiecePicker
+    ) -> None:
+        await self._exchange_bitfields(ih, peers, picker, st["signal"])
+        # one worker per peer
+        for peer in peers:
+            with self.dl_lock:
+                st["workers"] = st.get("workers", 0) + 1
+            self.plane.spawn(self._piece_worker(ih, st, peer, picker, st["signal"]))
 
-                    if sha256_hex(data) != st["piece_hashes"][idx]:
-                        self._log(f"piece {idx} hash mismatch -> requeue")
-                        st["buffers"].pop(idx, None)
+    async def _piece_worker(
+        self, ih: str, st: Dict[str, Any], peer: Dict[str, Any], picker: PiecePicker, signal: Signal
+    ) -> None:
+        """
+        Worker task pinned to a single peer.
+        - pieces come from the rarest-first picker, restricted to what this peer has
+        - keeps up to `win.size` pieces in flight (window adapts to RTT and loss)
+        - each request gets a future that _on_block resolves once the piece is assembled, verified and written
+        - on timeout only the missing blocks are re-requested (GET_BLOCKS), up to NACK_MAX_ROUNDS times
+        - then the piece is released back to the picker; its partial buffer is kept so the next try
+          only fetches what is missing
+        - after PEER_MAX_FAILURES failed pieces in a row the worker gives up on the peer and takes
+          it out of the picker's availability; a later tracker refresh may start it again
+        """
+        addr = (peer["host"], int(peer["port"]))
+        key = self._peer_key(peer)
+        loop = self.plane.loop
+        win = RequestWindow()
+        with self.dl_lock:
+            st.setdefault("windows", {})[key] = win  # for /api/status
+        # piece -> (request time, completion future, nack rounds, blocks missing when last NACKed)
+        inflight: Dict[int, Tuple[float, asyncio.Future, int, int]] = {}
+        nack_ok = True  # cleared if this peer ignores GET_BLOCKS (older node) -> plain GET_PIECE retries
+        failures = 0  # pieces in a row this peer failed or let time out
+        try:
+            while not st.get("stopped"):
+                # fill the pipeline
+                while len(inflight) < win.size:
+                    idx = picker.pick(key)
+                    if idx is None:
                         break
+                    fut = loop.create_future()
+                    with self.dl_lock:
+                        if st["completed"][idx] == 1:
+                            picker.complete(idx)
+                            continue
+                        missing = self._missing_blocks(st, idx) if nack_ok else []
+                        st["waiters"].setdefault(idx, []).append((fut, peer))
+
+                    tag = " endgame" if len(picker.requesters(idx)) > 1 else ""
+                    if missing:
+                        # partial buffer survived an earlier try -> fetch only the gaps
+                        self._log(f"request {len(missing)} missing blocks of piece {idx} from node {peer.get('node_id','?')}{tag}")
+                        self._request_piece(ih, idx, addr, missing)
+                    else:
+                        # log request
+                        self._log(
+                            f"request piece {idx} from node {peer.get('node_id','?')} @ {peer['host']}:{peer['port']} "
+                            f"(window={win.size}{tag})"
+                        )
+                        self._request_piece(ih, idx, addr)
+                    inflight[idx] = (time.time(), fut, 1 if missing else 0, len(missing))
+
+                if not inflight:
+                    if picker.is_complete:
+                        return
+                    # nothing this peer has is pickable right now: wait for a HAVE / released piece
+                    await signal.wait(1.0)
+                    continue
+
+                timeout = max(0.0, min(v[0] for v in inflight.values()) + win.rto - time.time())
+                done, _ = await asyncio.wait(
+                    [v[1] for v in inflight.values()], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                now = time.time()
+                for idx in [i for i, v in inflight.items() if v[1] in done]:
+                    sent, fut, nacks, _ = inflight.pop(idx)
+                    if fut.result():
+                        win.on_complete(now - sent if nacks == 0 else None)
+                        failures = 0
+                    else:
+                        failures += 1
+                        picker.release(idx, key)
+
+                for idx in [i for i, v in inflight.items() if now - v[0] >= win.rto]:
+                    sent, fut, nacks, nacked = inflight[idx]
+                    win.on_loss(sent)
+                    with self.dl_lock:
+                        missing = self._missing_blocks(st, idx)
+                    if nacked and len(missing) >= nacked:
+                        nack_ok = False  # not a single retransmitted block came back
+                    if missing and nack_ok and nacks < NACK_MAX_ROUNDS:
+                        # selective repeat: ask for just the lost blocks, keep the future
+                        self._log(f"piece {idx}: {len(missing)} blocks lost -> NACK round {nacks + 1}")
+                        self._request_piece(ih, idx, addr, missing)
+                        inflight[idx] = (now, fut, nacks + 1, len(missing))
+                        continue
+                    # timed out -> hand the piece back so another worker/another round can fetch it
+                    inflight.pop(idx)
+                    failures += 1
+                    self._drop_waiter(st, idx, fut)
+                    picker.release(idx, key)
+
+                if failures >= PEER_MAX_FAILURES:
+                    self._log(f"giving up on node {peer.get('node_id','?')} @ {peer['host']}:{peer['port']}: "
+                              f"{failures} pieces failed in a row")
+                    return
+        finally:
+            # stopped, given up or complete: nothing stays requested from this peer
+            for idx, v in inflight.items():
+                self._drop_waiter(st, idx, v[1])
+                picker.release(idx, key)
+            picker.remove_peer(key)
+            with self.dl_lock:
+                st["workers"] -= 1
+                st.get("peer_keys", set()).discard(key)
+                if st["windows"].get(key) is win:
+                    del st["windows"][key]
+
+    def _drop_waiter(self, st: Dict[str, Any], idx: int, fut: asyncio.Future) -> None:
+        with self.dl_lock:
+            ws = [w for w in st["waiters"].get(idx, []) if w[0] is not fut]
+            if ws:
+                st["waiters"][idx] = ws
+            else:
+                st["waiters"].pop(idx, None)
 
-                    # write piece
-                    self._write_piece(st, idx, data)
+    def _request_piece(self, ih: str, idx: int, addr: Tuple[str, int], blocks: Optional[List[int]] = None) -> None:
+        """
+        GET_PIECE, or GET_BLOCKS when only some blocks are missing. Advertises binary frames + PIECE_ACK,
+        and asks for the piece's Merkle leaves while we do not have them yet.
+        """
+        msg = {"type": T_GET_PIECE, "ih": ih, "piece": idx, "wire": BLOCK_WIRE_VERSION, "cc": 1}
+        if blocks:
+            msg["type"] = T_GET_BLOCKS
+            msg["blocks"] = blocks
+        st = self.downloads.get(ih)
+        if st and st.get("block_size") == BLOCK_SIZE and idx not in st.get("leaves", {}):
+            msg["leaves"] = 1
+        self._send_peer(msg, addr)
+
+    @staticmethod
+    def _missing_blocks(st: Dict[str, Any], idx: int) -> List[int]:
+        """Block indices still missing from a partial piece buffer ([] if nothing has arrived yet)."""
+        buf = st["buffers"].get(idx)
+        if not buf or not buf["blocks"]:
+            return []
+        return [b for b in range(buf["total"]) if b not in buf["blocks"]]
+
+    def _verify_and_write(
+        self, ih: str, idx: int, buf: Dict[str, Any], waiters: List[Tuple[asyncio.Future, Dict[str, Any]]]
+    ) -> bool:
+        """Runs on piece_pool: hash check + disk write of an assembled piece. The loop resolves the futures."""
+        try:
+            with self.dl_lock:
+                st = self.downloads.get(ih)
+                if st is None or st.get("finished") or st.get("stopped"):
+                    return False  # abandoned or finalized while this piece waited for the pool
+                already = st["completed"][idx] == 1
+            if already:
+                return True  # duplicate delivery, another worker already wrote it
+            data = b"".join(buf["blocks"][i] for i in range(buf["total"]))
+            if st.get("block_size"):
+                # every block already matched a proven leaf -> nothing left to hash
+                checked = buf.get("checked", set())
+                ok = all(i in checked for i in range(buf["total"])) or \
+                    merkle.piece_root(data, st["block_size"]).hex() == st["piece_hashes"][idx]
+            else:
+                ok = sha256_hex(data) == st["piece_hashes"][idx]
+            if not ok:
+                self._log(f"piece {idx} hash mismatch -> requeue")
+                return False
+            # write piece (concurrent writers use their own fd, pieces never overlap)
+            self._write_piece(st, idx, data)
+            with self.dl_lock:
+                if st["completed"][idx] == 0:
                     st["completed"][idx] = 1
                     st["done"] += 1
+                    st.get("leaves", {}).pop(idx, None)
                     self._save_resume(st)
-
+                    peer = waiters[0][1] if waiters else None
+                    src = f"node {peer.get('node_id','?')} @ {peer['host']}:{peer['port']}" if peer else "late blocks"
                     # log completed
-                    self._log(
-                        f"completed piece {idx} from node {peer.get('node_id','?')} @ {peer['host']}:{peer['port']}"
-                    )
-
+                    self._log(f"completed piece {idx} from {src}")
                     if st["done"] % 5 == 0 or st["done"] == st["total_pieces"]:
                         self._log(f"progress {st['done']}/{st['total_pieces']} pieces")
+            picker = st.get("picker")
+            if picker:
+                picker.complete(idx)
+            self._broadcast_have(st, idx)
+            return True
+        except Exception as e:
+            self._log(f"piece {idx} verify/write failed: {e}")
+            return False
 
-                    st["buffers"].pop(idx, None)
-                    success = True
+    # ---------------- Download ----------------
+    def _fetch_meta(
+        self, ih: str, compact: Dict[str, Any], peers: List[Dict[str, Any]], target_dir: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Full meta of a compact-announced torrent: the hash list of an interrupted download
+        if it still matches the infohash, otherwise its chunks fetched from the peers,
+        several in flight, each retry going to the next peer.
+        """
+        st = self._load_resume(compact["filename"], target_dir)
+        if st and st.get("infohash") == ih:
+            meta = expand_meta(compact, st.get("piece_hashes") or [])
+            if meta_infohash(meta) == ih:
+                return meta
+        peers = [p for p in peers if p.get("node_id") != self.node_id] or peers
+        asm = MetaAssembler(ih, compact)
+        self.meta_fetches[ih] = asm
+        try:
+            for rnd in range(4 * len(peers) + 4):
+                missing = asm.missing()
+                for i, c in enumerate(missing[:32]):
+                    p = peers[(c + rnd + i) % len(peers)]
+                    req = {"type": T_GET_META, "ih": ih, "chunk": c, "span": asm.span}
+                    self._send_peer(req, (p["host"], int(p["port"])))
+                if asm.done.wait(1.0):
+                    self._log(f"META fetched: {compact['filename']} {asm.chunks} chunks ({asm.pieces} hashes) from {len(peers)} peers")
+                    return asm.meta
+                if asm.failures > 3:
                     break
+            self._log(f"META fetch failed: {compact['filename']} ih={ih[:10]}.. "
+                      f"missing={len(asm.missing())}/{asm.chunks} mismatches={asm.failures}")
+            return None
+        finally:
+            self.meta_fetches.pop(ih, None)
 
-            if not success:
-                # timed out (or mismatch) -> re-queue so another worker/another round can fetch it
-                q.put(idx)
-
-            q.task_done()
-
-    # ---------------- Download ----------------
     def download_by_infohash(self, ih: str, target_dir: Optional[str] = None) -> None:
         resp = self._tracker_need(ih)
         if not resp.get("ok"):
@@ -470,14 +1150,19 @@ class Node:
             self._log("no peers available")
             return
 
+        if target_dir is None:
+            target_dir = self.download_dir
+
+        if is_compact(meta):
+            meta = self._fetch_meta(ih, meta, peers, target_dir)
+            if meta is None:
+                return
+
         filename = meta["filename"]
         size = int(meta["size"])
         piece_hashes = meta["piece_hashes"]
         total_pieces = len(piece_hashes)
 
-        if target_dir is None:
-            target_dir = self.download_dir
-
         st = self._load_resume(filename, target_dir)
         if st and st.get("infohash") == ih and st.get("piece_size") == PIECE_SIZE:
             st["piece_hashes"] = piece_hashes
@@ -507,10 +1192,15 @@ class Node:
             self._save_resume(st)
 
         self._ensure_partfile(st["part_path"], size)
+        # Merkle meta: leaf size and file root (0 / None for flat piece hashes)
+        st["block_size"] = int(meta.get("block_size") or 0)
+        st["root"] = meta.get("root")
 
         with self.dl_lock:
             self.downloads[ih] = st
             st["active_peers"] = peers
+            st["waiters"] = {}  # piece -> [(Future, peer)] of the workers waiting for it (several in endgame)
+            st["leaves"] = {}  # piece -> proven Merkle leaves, blocks are checked against them on arrival
 
         self._log(f"META ok: {filename} size={size} pieces={total_pieces} peers={len(peers)} ih={ih[:10]}..")
 
@@ -521,18 +1211,35 @@ class Node:
                 self.own_file(filename)
             return
 
-        import queue
-
-        q = queue.Queue()
-        for i in range(total_pieces):
-            if st["completed"][i] == 0:
-                q.put(i)
-
-        # one worker per peer
-        for peer in peers:
-            threading.Thread(target=self._piece_worker, args=(ih, peer, q), daemon=True).start()
-
-        q.join()
+        picker = PiecePicker(total_pieces, st["completed"])
+        # wakes the loop-side workers on HAVE / bitfield / release / completion
+        signal = self.plane.signal()
+        picker.add_listener(signal.fire)
+        with self.dl_lock:
+            st["picker"] = picker
+            st["signal"] = signal
+        # our verified pieces can be served to others while we download
+        self._announce_partial(ih, meta)
+        self._start_peer_workers(ih, st, peers, picker)
+
+        stalled, last = 0, picker.remaining
+        while not picker.wait_complete(PEER_REFRESH_SEC):
+            # the swarm grows as other downloaders announce themselves as partial owners
+            try:
+                resp = self._tracker_need(ih)
+            except Exception:
+                resp = {}
+            if resp.get("ok"):
+                self._start_peer_workers(ih, st, resp.get("peers", []), picker)
+            with self.dl_lock:
+                workers = st.get("workers", 0)
+            stalled = 0 if picker.remaining < last else stalled + 1
+            last = picker.remaining
+            # every worker gave up and the tracker had nobody new, or nothing arrived for a while
+            if not workers or stalled >= DOWNLOAD_STALL_ROUNDS:
+                self._log(f"download stalled: {filename} workers={workers} "
+                          f"no progress for {stalled * PEER_REFRESH_SEC:.0f}s")
+                break
 
         with self.dl_lock:
             st2 = self.downloads.get(ih)
@@ -546,7 +1253,15 @@ class Node:
                 missing = 0
                 if st2:
                     missing = st2["total_pieces"] - int(sum(st2["completed"]))
+                    # the resume file has every verified piece; stop the workers and free the entry
+                    st2["stopped"] = True
+                    del self.downloads[ih]
                 self._log(f"download finished but missing {missing} pieces (will resume on next run)")
+        if not picker.is_complete:
+            signal.fire()
+            # we no longer serve its pieces either
+            self._track_announce(ih, None)
+            self._send_tracker({"mode": MODE_EXIT, "node_id": self.node_id, "infohash": ih})
 
     def download_by_filename(self, filename: str, target_dir: Optional[str] = None) -> None:
         resp = self._tracker_find_by_name(filename)
@@ -611,64 +1326,70 @@ class Node:
 
     def _sync_node_files_loop(self) -> None:
         """
-        Background thread that syncs node_files directory every 5 seconds.
-        Implements bidirectional sync:
-        - Pull: Download files from other nodes if missing
-        - Push: Register local files with tracker
+        Background thread that pulls files from other nodes every 5 seconds: whatever is
+        in the tracker catalogue (only the changes are fetched) but not in the seed dir as
+        the watcher sees it. Pushing local files is _seed_worker's job, driven by the watcher.
         """
         SYNC_INTERVAL = 5  # seconds
-        
+
+        self.watcher.ready.wait()
         while True:
             try:
                 time.sleep(SYNC_INTERVAL)
-                
-                # Get list of files from tracker
-                resp = self._tracker_list()
-                if not resp.get("ok"):
+
+                # Get list of files from tracker (only what changed since the last pass)
+                if not self._refresh_catalog():
                     continue
-                
-                tracker_files = {}
-                for item in resp.get("items", []):
-                    filename = item.get("filename")
-                    if filename:
-                        tracker_files[filename] = item
-                
-                # PULL: Download missing files from other nodes
-                seed_dir_path = os.path.join("/app", self.seed_dir)
-                os.makedirs(seed_dir_path, exist_ok=True)
-                
-                local_files = set()
-                if os.path.exists(seed_dir_path):
-                    for fn in os.listdir(seed_dir_path):
-                        fp = os.path.join(seed_dir_path, fn)
-                        if os.path.isfile(fp) and not fn.endswith(('.part', '.resume.json')):
-                            local_files.add(fn)
-                
-                # Download files that exist on tracker but not locally
+
+                tracker_files = {item.get("filename") for item in self.catalog["items"].values()}
+                tracker_files.discard(None)
+
+                # PULL: Download files that exist on tracker but not locally
+                local_files = self.watcher.files()
                 for filename in tracker_files:
                     if filename not in local_files:
                         self._sync_file_to_dir(filename, self.seed_dir)
-                
-                # PUSH: Register local files with tracker
-                for filename in local_files:
-                    file_path = os.path.join(seed_dir_path, filename)
-                    if not os.path.isfile(file_path):
-                        continue
-                    
-                    # Check if file is already registered
-                    try:
-                        ih, meta = self._build_meta(file_path)
-                        if ih not in self.seeding:
-                            # File exists locally but not registered, register it
-                            self.own_file(filename)
-                    except Exception as e:
-                        self._log(f"SYNC: Error registering {filename}: {e}")
-                        continue
-                
+
             except Exception as e:
                 self._log(f"SYNC: Error in sync loop: {e}")
                 continue
 
+    def _seed_worker(self) -> None:
+        """
+        PUSH side of the sync: announce files the watcher reports as new or changed (the
+        meta cache only hashes when the file's identity changed) and withdraw the swarms
+        of files that were replaced or went away.
+        """
+        while True:
+            filename, present = self.seed_events.get()
+            path = os.path.join("/app", self.seed_dir, filename)
+            try:
+                old = self.seed_index.ih_of(path)
+                if present:
+                    ih, _ = self._build_meta(path)
+                    if ih not in self.seeding:
+                        # File exists locally but not registered, register it
+                        self.own_file(filename)
+                else:
+                    ih = None
+                    self.seed_index.forget(path)
+                    self.meta_cache.forget(path)
+                # the same content may still be seeded from another file
+                if old and old != ih and self.seed_index.lookup(old) is None:
+                    self._unseed(old, filename)
+            except Exception as e:
+                self._log(f"SYNC: Error registering {filename}: {e}")
+
+    def _unseed(self, ih: str, filename: str) -> None:
+        with self.dl_lock:
+            st = self.downloads.get(ih)
+            if ih not in self.seeding or (st and not st.get("finished")):
+                return
+            self.seeding.discard(ih)
+        self._track_announce(ih, None)
+        self._send_tracker({"mode": MODE_EXIT, "node_id": self.node_id, "infohash": ih})
+        self._log(f"SEED withdrawn: {filename} ih={ih[:10]}.. (file changed or removed)")
+
     # ---------------- API Server ----------------
     def start_api(self, api_port: int = 5000) -> None:
         """
@@ -680,6 +1401,7 @@ class Node:
         - GET /api/torrent/list - List files on tracker (requires Basic Auth)
         - POST /api/torrent/download - Download a file by filename or infohash (requires Basic Auth)
         - POST /api/exit - Gracefully exit (requires Basic Auth)
+        - GET /api/peers/congestion - Per-peer sender cwnd/RTT stats (requires Basic Auth)
         """
         app = Flask(__name__)
         CORS(app)  # Enable CORS for all routes
@@ -891,6 +1613,7 @@ class Node:
             """Gracefully exit - notify tracker about all downloads - requires Basic Auth"""
             with self.dl_lock:
                 for ih in list(self.downloads.keys()):
+                    self._track_announce(ih, None)
                     self._send_tracker({"mode": MODE_EXIT, "node_id": self.node_id, "infohash": ih})
             self._log("API exit requested")
             # Note: Flask will continue running, but downloads are cleaned up
@@ -907,7 +1630,8 @@ class Node:
                         "infohash": ih[:10] + "..",
                         "filename": st.get("filename"),
                         "progress": f"{st.get('done', 0)}/{st.get('total_pieces', 0)}",
-                        "size": st.get("size")
+                        "size": st.get("size"),
+                        "request_windows": {k: w.stats() for k, w in st.get("windows", {}).items()},
                     })
             
             return jsonify({
@@ -915,7 +1639,11 @@ class Node:
                 "node_id": self.node_id,
                 "seeding_count": len(self.seeding),
                 "active_downloads": active_downloads,
-                "downloads_count": len(self.downloads)
+                "downloads_count": len(self.downloads),
+                "dataplane": self.plane.stats(),
+                "tracker_client": dict(self.tracker_client.stats),
+                "tracker_cache": dict(self.tracker_cache.stats),
+                "seed_watcher": dict(self.watcher.stats, mode=self.watcher.mode)
             })
 
         @app.route('/api/nodes/connected', methods=['GET'])
@@ -931,43 +1659,41 @@ class Node:
             with self.dl_lock:
                 active_swarms = set(self.downloads.keys()) | set(self.seeding)
             
-            # Query tracker for each swarm to get current active peers
+            # Ask the tracker for all swarms at once (batched NEED, one round trip)
             # The tracker automatically filters out inactive nodes (outside TTL)
-            for ih in active_swarms:
-                try:
-                    resp = self._tracker_need(ih)
-                    if resp.get("ok"):
-                        peers = resp.get("peers", [])
-                        for peer in peers:
-                            # Exclude self
-                            if peer.get("node_id") == self.node_id:
-                                continue
-                            
-                            # Create unique key for deduplication
-                            node_id = peer.get("node_id")
-                            host = peer.get("host")
-                            port = peer.get("port")
-                            key = (node_id, host, port)
-                            
-                            # Only add if not already seen or update with latest info
-                            if key not in connected_nodes:
-                                connected_nodes[key] = {
-                                    "node_id": node_id,
-                                    "host": host,
-                                    "port": port,
-                                    "swarms": []
-                                }
-                            
-                            # Track which swarms this node is in
-                            swarm_info = {
-                                "infohash": ih[:10] + "..",
-                                "filename": resp.get("meta", {}).get("filename", "unknown")
-                            }
-                            if swarm_info not in connected_nodes[key]["swarms"]:
-                                connected_nodes[key]["swarms"].append(swarm_info)
-                except Exception as e:
-                    self._log(f"Error querying tracker for swarm {ih[:10]}..: {e}")
-                    continue
+            try:
+                swarms = self._tracker_need_many(sorted(active_swarms))
+            except Exception as e:
+                self._log(f"Error querying tracker for {len(active_swarms)} swarms: {e}")
+                swarms = {}
+            for ih, found in swarms.items():
+                for peer in found.get("peers", []):
+                    # Exclude self
+                    if peer.get("node_id") == self.node_id:
+                        continue
+
+                    # Create unique key for deduplication
+                    node_id = peer.get("node_id")
+                    host = peer.get("host")
+                    port = peer.get("port")
+                    key = (node_id, host, port)
+
+                    # Only add if not already seen or update with latest info
+                    if key not in connected_nodes:
+                        connected_nodes[key] = {
+                            "node_id": node_id,
+                            "host": host,
+                            "port": port,
+                            "swarms": []
+                        }
+
+                    # Track which swarms this node is in
+                    swarm_info = {
+                        "infohash": ih[:10] + "..",
+                        "filename": found.get("filename") or "unknown"
+                    }
+                    if swarm_info not in connected_nodes[key]["swarms"]:
+                        connected_nodes[key]["swarms"].append(swarm_info)
             
             # Convert to list format
             nodes_list = list(connected_nodes.values())
@@ -978,6 +1704,13 @@ class Node:
                 "count": len(nodes_list)
             })
 
+        @app.route('/api/peers/congestion', methods=['GET'])
+        @requires_auth
+        def api_congestion():
+            """Per-peer sender congestion control state (cwnd, rate, RTT) - requires Basic Auth"""
+            peers = self.pacers.stats()
+            return jsonify({"ok": True, "peers": peers, "count": len(peers)})
+
         @app.route('/health', methods=['GET'])
         def health():
             """Health check endpoint"""
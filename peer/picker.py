@@ -0,0 +1,160 @@
+import random
+import threading
+from typing import Callable, Dict, List, Optional, Set, Iterable
+
+
+class PiecePicker:
+    """
+    Rarest-first piece selection with BitTorrent style endgame.
+
+    - every peer has a bitfield (None = full seed, e.g. legacy peers that never answer GET_BITFIELD)
+    - pending pieces (not completed, not requested) are bucketed by availability so the
+      rarest piece a peer has is found without scanning the whole file
+    - once every missing piece is already requested, endgame lets idle peers request the
+      same pieces again; the first copy wins and the others get cancelled
+    """
+
+    def __init__(self, total: int, completed: Iterable[int]):
+        self.total = total
+        self._cond = threading.Condition()
+        self._completed = [bool(c) for c in completed]
+        self._remaining = self._completed.count(False)
+        self._avail = [0] * total
+        self._seeds: Set[str] = set()
+        self._bits: Dict[str, Set[int]] = {}  # partial peers only
+        self._requested: Dict[int, Set[str]] = {}  # piece -> peers it is requested from
+        self._buckets: Dict[int, Set[int]] = {0: {i for i in range(total) if not self._completed[i]}}
+        self._listeners: List[Callable[[], None]] = []
+
+    def add_listener(self, fn: Callable[[], None]) -> None:
+        """fn() is called (under the picker lock, so keep it cheap) whenever waiters would be woken."""
+        with self._cond:
+            self._listeners.append(fn)
+
+    def _changed(self) -> None:
+        self._cond.notify_all()
+        for fn in self._listeners:
+            fn()
+
+    # ---------------- availability ----------------
+    def _move(self, idx: int, delta: int) -> None:
+        a = self._avail[idx]
+        self._avail[idx] = a + delta
+        if not self._completed[idx] and idx not in self._requested:
+            self._buckets.get(a, set()).discard(idx)
+            self._buckets.setdefault(a + delta, set()).add(idx)
+
+    def add_peer(self, key: str, bits: Optional[Iterable[int]]) -> None:
+        """bits=None -> full seed, else the piece indices the peer has."""
+        with self._cond:
+            self._drop_locked(key)
+            if bits is None:
+                self._seeds.add(key)
+                for i in range(self.total):
+                    self._move(i, 1)
+            else:
+                have = {i for i in bits if 0 <= i < self.total}
+                self._bits[key] = have
+                for i in have:
+                    self._move(i, 1)
+            self._changed()
+
+    def have(self, key: str, idx: int) -> None:
+        with self._cond:
+            have = self._bits.get(key)
+            if have is None or not 0 <= idx < self.total or idx in have:
+                return
+            have.add(idx)
+            self._move(idx, 1)
+            self._changed()
+
+    def remove_peer(self, key: str) -> None:
+        with self._cond:
+            self._drop_locked(key)
+
+    def _drop_locked(self, key: str) -> None:
+        if key in self._seeds:
+            self._seeds.discard(key)
+            for i in range(self.total):
+                self._move(i, -1)
+        for i in self._bits.pop(key, set()):
+            self._move(i, -1)
+
+    def known_peers(self) -> Set[str]:
+        with self._cond:
+            return self._seeds | set(self._bits)
+
+    def peer_has(self, key: str, idx: int) -> bool:
+        return key in self._seeds or idx in self._bits.get(key, ())
+
+    # ---------------- selection ----------------
+    def pick(self, key: str) -> Optional[int]:
+        with self._cond:
+            for a in sorted(b for b, s in self._buckets.items() if s and b > 0):
+                cands = []
+                for i in self._buckets[a]:
+                    if self.peer_has(key, i):
+                        cands.append(i)
+                        if len(cands) >= 8:
+                            break
+                if cands:
+                    idx = random.choice(cands)  # random tie-break spreads downloaders over the file
+                    self._buckets[a].discard(idx)
+                    self._requested[idx] = {key}
+                    return idx
+            if not self.endgame:
+                return None
+            # endgame: duplicate an outstanding request this peer is not already serving
+            best = None
+            for idx, who in self._requested.items():
+                if key in who or not self.peer_has(key, idx):
+                    continue
+                if best is None or len(who) < len(self._requested[best]):
+                    best = idx
+            if best is not None:
+                self._requested[best].add(key)
+            return best
+
+    @property
+    def endgame(self) -> bool:
+        """Every missing piece is already requested from someone."""
+        return self._remaining > 0 and not any(s for b, s in self._buckets.items() if b > 0)
+
+    def release(self, idx: int, key: str) -> None:
+        """Request from `key` failed/timed out; piece goes back to pending if nobody else has it in flight."""
+        with self._cond:
+            who = self._requested.get(idx)
+            if who is None:
+                return
+            who.discard(key)
+            if not who:
+                del self._requested[idx]
+                if not self._completed[idx]:
+                    self._buckets.setdefault(self._avail[idx], set()).add(idx)
+            self._changed()
+
+    def requesters(self, idx: int) -> List[str]:
+        with self._cond:
+            return list(self._requested.get(idx, ()))
+
+    def complete(self, idx: int) -> None:
+        with self._cond:
+            if self._completed[idx]:
+                return
+            self._completed[idx] = True
+            self._remaining -= 1
+            self._requested.pop(idx, None)
+            self._buckets.get(self._avail[idx], set()).discard(idx)
+            self._changed()
+
+    @property
+    def is_complete(self) -> bool:
+        return self._remaining == 0
+
+    @property
+    def remaining(self) -> int:
+        return self._remaining
+
+    def wait_complete(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self._remaining == 0, timeout)
@@ -0,0 +1,116 @@
+import os
+import mmap
+import socket
+import threading
+from collections import OrderedDict
+from typing import Any, Tuple, Optional, Iterable, Iterator, List
+
+from common.constants import T_PIECE_BLOCK
+from common.protocol import infohash_raw, pack_block_header_raw
+from common.utils import jencode, b64e
+
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+
+class MmapCache:
+    """
+    LRU of read-only mmaps of seeded files.
+    A file is mapped once and every piece is served as a memoryview slice of
+    the page cache. Maps are keyed by (path, inode, size, mtime_ns) so a
+    replaced/truncated file is never served from a stale map.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self._maps: "OrderedDict[str, Tuple[Tuple[int, int, int], mmap.mmap]]" = OrderedDict()
+
+    def view(self, path: str, track_mtime: bool = True) -> Optional[memoryview]:
+        """
+        track_mtime=False for files we write ourselves in place (.part): the
+        shared mapping already sees our writes, remapping on every write would thrash.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        ident = (st.st_ino, st.st_size, st.st_mtime_ns if track_mtime else 0)
+        with self._lock:
+            ent = self._maps.get(path)
+            if ent and ent[0] == ident:
+                self._maps.move_to_end(path)
+                return memoryview(ent[1])
+            if ent:
+                self._close(self._maps.pop(path)[1])
+        if st.st_size == 0:
+            return None  # mmap cannot map empty files
+        with open(path, "rb") as fp:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._lock:
+            self._maps[path] = (ident, mm)
+            self._maps.move_to_end(path)
+            while len(self._maps) > self.capacity:
+                _, (_, old) = self._maps.popitem(last=False)
+                self._close(old)
+        return memoryview(mm)
+
+    @staticmethod
+    def _close(mm: mmap.mmap) -> None:
+        try:
+            mm.close()
+        except BufferError:
+            # a sender still holds a view; the map is released when that view dies
+            pass
+
+    def clear(self) -> None:
+        with self._lock:
+            while self._maps:
+                _, (_, mm) = self._maps.popitem(last=False)
+                self._close(mm)
+
+
+def piece_view(file_view: memoryview, idx: int, piece_size: int) -> memoryview:
+    start = idx * piece_size
+    return file_view[start : start + piece_size]
+
+
+def piece_frames(
+    ih: str,
+    idx: int,
+    piece: memoryview,
+    block_size: int,
+    binary: bool,
+    only: Optional[Iterable[int]] = None,
+) -> Iterator[Tuple[int, List[Any]]]:
+    """
+    Yields (payload bytes, buffers of one datagram) for every block of a piece (or just `only`).
+    Binary frames are [header, payload view] so the payload can be gathered by sendmsg
+    straight from the mmap; JSON peers still get a single base64 message.
+    """
+    total_blocks = (len(piece) + block_size - 1) // block_size if len(piece) else 0
+    ih_raw = infohash_raw(ih) if binary else b""
+    blocks = range(total_blocks) if only is None else sorted({b for b in only if 0 <= b < total_blocks})
+    for b in blocks:
+        blk = piece[b * block_size : (b + 1) * block_size]
+        if binary:
+            yield len(blk), [pack_block_header_raw(ih_raw, idx, b, total_blocks), blk]
+            continue
+        # legacy JSON+base64 for peers that did not advertise the binary frame
+        msg = {
+            "type": T_PIECE_BLOCK,
+            "ih": ih,
+            "piece": idx,
+            "block": b,
+            "total_blocks": total_blocks,
+            "data": b64e(blk),
+        }
+        yield len(blk), [jencode(msg)]
+
+
+def send_frame(sock: socket.socket, parts: List[Any], addr: Tuple[str, int]) -> None:
+    if len(parts) == 1:
+        sock.sendto(parts[0], addr)
+    elif HAS_SENDMSG:
+        sock.sendmsg(parts, [], 0, addr)
+    else:
+        sock.sendto(b"".join(parts), addr)
@@ -0,0 +1,72 @@
+import time
+from typing import Optional
+
+from common.constants import PIPELINE_INIT, PIPELINE_MAX
+
+
+class RequestWindow:
+    """
+    Per-peer request queue depth, sized like a BitTorrent request pipeline:
+    - RTT is tracked TCP style (srtt / rttvar) from request -> piece complete
+    - the window grows on every completed piece (slow start, then +1/window)
+    - a timed out piece counts as loss: the window is halved, at most once per
+      round trip (requests sent before the last halving share its loss event)
+    The piece timeout (rto) follows the measured RTT instead of a fixed 5s.
+    """
+
+    MIN_RTO = 1.0
+    MAX_RTO = 5.0
+
+    def __init__(self, init: int = PIPELINE_INIT, max_size: int = PIPELINE_MAX):
+        self.max_size = max(1, max_size)
+        self.cwnd = float(min(max(1, init), self.max_size))
+        self.ssthresh = float(self.max_size)
+        self.srtt = None
+        self.rttvar = 0.0
+        self.acked = 0
+        self.lost = 0
+        self.last_decrease = 0.0
+
+    @property
+    def size(self) -> int:
+        return int(self.cwnd)
+
+    @property
+    def rto(self) -> float:
+        if self.srtt is None:
+            return self.MAX_RTO
+        return min(self.MAX_RTO, max(self.MIN_RTO, self.srtt + 4 * self.rttvar))
+
+    def on_complete(self, rtt: Optional[float]) -> None:
+        """rtt=None for retransmitted pieces (Karn: ambiguous sample, only grow the window)."""
+        self.acked += 1
+        if rtt is None:
+            pass
+        elif self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        if self.cwnd < self.ssthresh:
+            self.cwnd += 1
+        else:
+            self.cwnd += 1 / self.cwnd
+        self.cwnd = min(self.cwnd, float(self.max_size))
+
+    def on_loss(self, sent: float) -> None:
+        """`sent`: time.time() the lost request went out."""
+        self.lost += 1
+        if sent < self.last_decrease:
+            return
+        self.last_decrease = time.time()
+        self.ssthresh = max(1.0, self.cwnd / 2)
+        self.cwnd = self.ssthresh
+
+    def stats(self) -> dict:
+        return {
+            "window": self.size,
+            "srtt_ms": round(self.srtt * 1000, 1) if self.srtt is not None else None,
+            "rto_ms": round(self.rto * 1000, 1),
+            "acked": self.acked,
+            "lost": self.lost,
+        }
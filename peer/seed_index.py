@@ -0,0 +1,196 @@
+import os
+import json
+import stat
+import time
+import tempfile
+import threading
+from typing import Dict, Any, Tuple, Optional, Callable, List
+
+
+BuildMeta = Callable[[str], Tuple[str, Dict[str, Any]]]
+CachedMeta = Callable[[str], Optional[Tuple[str, Dict[str, Any]]]]
+# download leftovers that live next to seed files and are never seeded themselves
+PARTIAL_SUFFIXES = (".part", ".resume.json", ".resume.json.tmp")
+
+
+def file_identity(st: os.stat_result) -> List[int]:
+    """(inode, size, mtime_ns) -- changes whenever the file content may have changed."""
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+class SeedIndex:
+    """
+    infohash -> seed file index.
+    - lookup is a dict hit plus one os.stat() to make sure the file is unchanged
+    - entries are invalidated by (inode, size, mtime)
+    - persisted as JSON so a restart does not rehash the whole seed dir; only
+      (path, identity) go to disk, the metadata comes back from the meta cache on load
+    - changes are written at most once per SAVE_DELAY, not once per change
+    """
+
+    RESCAN_MIN_INTERVAL = 2.0  # seconds between directory rescans on lookup miss
+    SAVE_DELAY = 1.0  # seconds a change may wait before the index is written
+
+    def __init__(self, seed_root: str, index_path: str, build_meta: BuildMeta, cached_meta: CachedMeta,
+                 log: Callable[[str], None]):
+        self.seed_root = seed_root
+        self.index_path = index_path
+        self._build_meta = build_meta
+        self._cached_meta = cached_meta  # (ih, meta) of an unchanged, already hashed file, else None
+        self._log = log
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer at a time
+        self._by_ih: Dict[str, Dict[str, Any]] = {}  # ih -> {path, ident, meta}
+        self._by_path: Dict[str, str] = {}  # path -> ih
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        self._last_scan = 0.0
+        self.load()
+
+    # ---------------- persistence ----------------
+    def load(self) -> None:
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+        except Exception as e:
+            self._log(f"seed index load failed: {e}")
+            return
+        entries = data.get("entries") or {}
+        for ih, ent in entries.items():
+            # files whose metadata is no longer cached are picked up again by refresh()
+            cached = self._cached_meta(ent["path"])
+            if cached is None or cached[0] != ih:
+                continue
+            with self._lock:
+                self._by_ih[ih] = {"path": ent["path"], "ident": ent["ident"], "meta": cached[1]}
+                self._by_path[ent["path"]] = ih
+        if len(self._by_ih) != len(entries):
+            self._mark_dirty()
+        self._log(f"seed index loaded: {len(self._by_ih)} entries")
+
+    def _mark_dirty(self) -> None:
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.SAVE_DELAY, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def save(self) -> None:
+        with self._save_lock:
+            with self._lock:
+                self._save_timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                entries = {ih: {"path": e["path"], "ident": e["ident"]} for ih, e in self._by_ih.items()}
+            tmp = None
+            try:
+                d = os.path.dirname(self.index_path)
+                os.makedirs(d, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(prefix=".seed_index.", suffix=".tmp", dir=d)
+                with os.fdopen(fd, "w", encoding="utf-8") as fp:
+                    json.dump({"version": 2, "entries": entries}, fp, ensure_ascii=False)
+                os.replace(tmp, self.index_path)
+            except Exception as e:
+                self._log(f"seed index save failed: {e}")
+                if tmp and os.path.exists(tmp):
+                    os.unlink(tmp)
+
+    # ---------------- mutation ----------------
+    def add(self, path: str, ih: str, meta: Dict[str, Any], st: Optional[os.stat_result] = None) -> None:
+        if st is None:
+            st = os.stat(path)
+        with self._lock:
+            self._drop_path_locked(path)
+            self._by_ih[ih] = {"path": path, "ident": file_identity(st), "meta": meta}
+            self._by_path[path] = ih
+        self._mark_dirty()
+
+    def forget(self, path: str) -> None:
+        """The file at `path` is gone."""
+        with self._lock:
+            if path not in self._by_path:
+                return
+            self._drop_path_locked(path)
+        self._mark_dirty()
+
+    def _drop_path_locked(self, path: str) -> None:
+        old = self._by_path.pop(path, None)
+        if old is not None and self._by_ih.get(old, {}).get("path") == path:
+            self._by_ih.pop(old, None)
+
+    # ---------------- lookup ----------------
+    def ih_of(self, path: str) -> Optional[str]:
+        """Infohash the file at `path` had when it was last indexed (no stat)."""
+        with self._lock:
+            return self._by_path.get(path)
+
+    def lookup(self, ih: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            ent = self._by_ih.get(ih)
+        if not ent:
+            return None
+        try:
+            st = os.stat(ent["path"])
+        except OSError:
+            st = None
+        if st is None or file_identity(st) != ent["ident"]:
+            # file removed or modified since it was hashed -> stale
+            with self._lock:
+                self._drop_path_locked(ent["path"])
+            self._mark_dirty()
+            return None
+        return ent["path"], ent["meta"]
+
+    def find(self, ih: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Lookup; on miss rescan the seed dir (hashing only new/changed files) and retry."""
+        found = self.lookup(ih)
+        if found:
+            return found
+        now = time.time()
+        if now - self._last_scan < self.RESCAN_MIN_INTERVAL:
+            return None
+        self.refresh()
+        return self.lookup(ih)
+
+    def refresh(self) -> None:
+        self._last_scan = time.time()
+        if not os.path.isdir(self.seed_root):
+            return
+        changed = False
+        seen = set()
+        for fn in os.listdir(self.seed_root):
+            if fn.endswith(PARTIAL_SUFFIXES):
+                continue
+            fp = os.path.join(self.seed_root, fn)
+            try:
+                st = os.stat(fp)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            seen.add(fp)
+            with self._lock:
+                ih = self._by_path.get(fp)
+                ent = self._by_ih.get(ih) if ih else None
+            if ent and ent["ident"] == file_identity(st):
+                continue
+            try:
+                ih2, meta = self._build_meta(fp)
+            except Exception:
+                continue
+            with self._lock:
+                self._drop_path_locked(fp)
+                self._by_ih[ih2] = {"path": fp, "ident": file_identity(st), "meta": meta}
+                self._by_path[fp] = ih2
+            changed = True
+        with self._lock:
+            for fp in [p for p in self._by_path if p not in seen]:
+                self._drop_path_locked(fp)
+                changed = True
+        if changed:
+            self._mark_dirty()
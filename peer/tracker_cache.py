@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from common.constants import (
+    MODE_NEED,
+    MODE_FIND_BY_NAME,
+    TRACKER_CACHE_NEED_SEC,
+    TRACKER_CACHE_FIND_SEC,
+    TRACKER_CACHE_NEG_SEC,
+    TRACKER_CACHE_ENTRIES,
+)
+
+# batched NEED entries: peers and filename of one swarm, no meta
+PEERS = "PEERS"
+
+
+class TrackerCache:
+    """
+    Short-lived cache of tracker replies, keyed by (mode, key), LRU-bounded.
+    - ok replies live for their mode's TTL, NOT_FOUND ones for `negative_ttl`
+    - BUSY and other errors are never cached, so a retry goes to the tracker
+    - our own OWN/EXIT invalidate the swarm and filename they change
+    Cached replies are shared between callers: do not modify them.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, negative_ttl: float = TRACKER_CACHE_NEG_SEC,
+                 max_entries: int = TRACKER_CACHE_ENTRIES):
+        self.ttls = ttls if ttls is not None else {
+            MODE_NEED: TRACKER_CACHE_NEED_SEC,
+            PEERS: TRACKER_CACHE_NEED_SEC,
+            MODE_FIND_BY_NAME: TRACKER_CACHE_FIND_SEC,
+        }
+        self.negative_ttl = negative_ttl
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "invalidated": 0}
+
+    def get(self, mode: str, key: str) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            ent = self._entries.get((mode, key))
+            if ent is None or ent[0] <= now:
+                if ent is not None:
+                    del self._entries[(mode, key)]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end((mode, key))
+            self.stats["negative_hits" if ent[1].get("error") == "NOT_FOUND" else "hits"] += 1
+            return ent[1]
+
+    def put(self, mode: str, key: str, resp: Dict[str, Any]) -> None:
+        if resp.get("ok"):
+            ttl = self.ttls.get(mode, 0.0)
+        elif resp.get("error") == "NOT_FOUND":
+            ttl = self.negative_ttl
+        else:
+            return
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[(mode, key)] = (time.monotonic() + ttl, resp)
+            self._entries.move_to_end((mode, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, ih: Optional[str] = None, filename: Optional[str] = None) -> None:
+        """Forget everything about swarm `ih` and file `filename` (lookups by name that returned `ih` too)."""
+        with self._lock:
+            drop = [k for k, (_, resp) in self._entries.items()
+                    if (ih and k[1] == ih) or (filename and k == (MODE_FIND_BY_NAME, filename))
+                    or (ih and k[0] == MODE_FIND_BY_NAME and _names(resp, ih))]
+            for k in drop:
+                del self._entries[k]
+            self.stats["invalidated"] += len(drop)
+
+
+def _names(resp: Dict[str, Any], ih: str) -> bool:
+    """True if a FIND_BY_NAME reply mentions swarm `ih`."""
+    matches = [resp["match"]] if resp.get("match") else resp.get("matches", [])
+    return any(m.get("infohash") == ih for m in matches)
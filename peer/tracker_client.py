@@ -0,0 +1,127 @@
+import itertools
+import socket
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from common.constants import BUFFER_SIZE, TRACKER_TIMEOUT, TRACKER_RETRIES
+from common.utils import jencode, jdecode
+
+
+class TrackerClient:
+    """
+    Request/reply client for the tracker over one long-lived UDP socket.
+    - every request carries a `rid` that the tracker echoes; a receiver thread hands
+      each reply to the caller waiting for it, so any number of requests from any
+      number of threads can be in flight at once
+    - a request without a reply is sent again (same rid) with the wait doubled each
+      time; BUSY replies are retried after the tracker's `retry_after`
+    - call_many() sends a whole batch before waiting, so a fan-out costs one RTT
+    """
+
+    MAX_RETRY_AFTER = 5.0
+
+    def __init__(self, addr: Tuple[str, int], log: Callable[[str], None],
+                 timeout: float = TRACKER_TIMEOUT, retries: int = TRACKER_RETRIES):
+        self.addr = addr
+        self.log = log
+        self.timeout = max(0.01, timeout)
+        self.retries = max(0, retries)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("0.0.0.0", 0))
+        self._rids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self.stats = {"requests": 0, "sent": 0, "retries": 0, "busy": 0, "timeouts": 0, "stray": 0}
+        threading.Thread(target=self._recv_loop, name="tracker-client", daemon=True).start()
+
+    def _recv_loop(self) -> None:
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(BUFFER_SIZE)
+                resp = jdecode(data)
+            except Exception:
+                continue
+            rid = resp.get("rid") if isinstance(resp, dict) else None
+            with self._lock:
+                fut = self._pending.pop(rid, None) if isinstance(rid, int) else None
+                if fut is None:
+                    # late reply to a request that was answered already or gave up
+                    self.stats["stray"] += 1
+            if fut is None:
+                continue
+            if not fut.done():
+                fut.set_result(resp)
+
+    def _send(self, rid: int, req: Dict[str, Any]) -> Future:
+        fut: Future = Future()
+        with self._lock:
+            self._pending[rid] = fut
+        self._transmit(rid, req)
+        return fut
+
+    def _transmit(self, rid: int, req: Dict[str, Any]) -> None:
+        try:
+            self.sock.sendto(jencode(dict(req, rid=rid)), self.addr)
+            self._count(sent=1)
+        except OSError as e:
+            # counts as lost: the retry round sends it again
+            self.log(f"tracker send failed: {e}")
+
+    def _count(self, **deltas: int) -> None:
+        # bumped from the receiver thread and every caller thread
+        with self._lock:
+            for k, n in deltas.items():
+                self.stats[k] += n
+
+    def call(self, req: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """One request; raises socket.timeout if every attempt went unanswered."""
+        resp = self.call_many([req], timeout)[0]
+        if resp is None:
+            raise socket.timeout(f"tracker {req.get('mode')} timed out")
+        return resp
+
+    def call_many(self, reqs: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Send all requests, then wait for the replies together. Replies come back in
+        request order; None where every attempt went unanswered. A BUSY reply is
+        returned as is once the retries are used up.
+        """
+        wait_for = self.timeout if timeout is None else max(0.01, timeout)
+        self._count(requests=len(reqs))
+        rids = [next(self._rids) for _ in reqs]
+        futs = {i: self._send(rids[i], req) for i, req in enumerate(reqs)}
+        results: List[Optional[Dict[str, Any]]] = [None] * len(reqs)
+        try:
+            for attempt in range(self.retries + 1):
+                wait(list(futs.values()), timeout=wait_for * (2 ** attempt))
+                last = attempt == self.retries
+                lost, busy, pause = [], [], 0.0
+                for i, fut in futs.items():
+                    if not fut.done():
+                        lost.append(i)
+                        continue
+                    resp = fut.result()
+                    if resp.get("error") == "BUSY" and not last:
+                        busy.append(i)
+                        pause = max(pause, min(self.MAX_RETRY_AFTER, float(resp.get("retry_after", 1))))
+                        continue
+                    results[i] = resp
+                if last or not (lost or busy):
+                    self._count(timeouts=len(lost))
+                    break
+                self._count(retries=len(lost) + len(busy), busy=len(busy))
+                if pause:
+                    time.sleep(pause)
+                # lost ones keep their future: a late reply to the first send still counts
+                futs = {i: futs[i] for i in lost}
+                for i in lost:
+                    self._transmit(rids[i], reqs[i])
+                for i in busy:
+                    futs[i] = self._send(rids[i], reqs[i])
+        finally:
+            with self._lock:
+                for rid in rids:
+                    self._pending.pop(rid, None)
+        return results
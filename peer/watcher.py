@@ -0,0 +1,243 @@
+import os
+import stat
+import time
+import errno
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from common.constants import SEED_WATCH, SEED_SCAN_SEC, SEED_RESCAN_SEC
+from peer.seed_index import PARTIAL_SUFFIXES, file_identity
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# a file is only looked at once it was closed after writing or renamed into place
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; then `len` bytes of NUL-padded name
+
+Ident = Tuple[int, int, int]
+
+
+class Inotify:
+    """Minimal inotify binding through libc's ctypes symbols; OSError where the kernel or libc has none."""
+
+    def __init__(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            init1 = libc.inotify_init1
+        except (OSError, TypeError, AttributeError) as e:
+            raise OSError(errno.ENOSYS, f"inotify not available: {e}")
+        self._libc = libc
+        self.fd = init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read(self, timeout: Optional[float]) -> List[Tuple[int, int, str]]:
+        """(wd, mask, name) of the queued events; waits up to `timeout` for the first one."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        out, off = [], 0
+        while off + _EVENT.size <= len(data):
+            wd, mask, _, n = _EVENT.unpack_from(data, off)
+            off += _EVENT.size
+            out.append((wd, mask, os.fsdecode(data[off:off + n].rstrip(b"\0"))))
+            off += n
+        return out
+
+
+class SeedWatcher:
+    """
+    Change feed of the seed directory: puts (filename, present) on `out` for every file
+    that appeared, was rewritten or went away, so only those get hashed and announced.
+    - inotify when available: a file is reported when it is closed after writing or
+      renamed in; a queue overflow or the directory itself going away triggers a rescan,
+      and a slow rescan every `rescan` seconds catches what inotify cannot see
+      (changes made from outside a container's bind mount)
+    - otherwise one scandir pass every `interval` seconds comparing (inode, size, mtime);
+      a new identity is reported once it held still for a pass, so a copy in progress
+      is not hashed half-way
+    The first pass reports every file, so the consumer starts from a full view.
+    """
+
+    def __init__(self, root: str, out: "queue.Queue[Tuple[str, bool]]", log: Callable[[str], None],
+                 mode: str = SEED_WATCH, interval: float = SEED_SCAN_SEC, rescan: float = SEED_RESCAN_SEC):
+        self.root = root
+        self.out = out
+        self.log = log
+        self.interval = max(0.1, interval)
+        self.rescan = rescan
+        self._lock = threading.Lock()
+        self._known: Dict[str, Ident] = {}  # reported files
+        self._pending: Dict[str, Ident] = {}  # changed since the last pass, not reported yet
+        self._wd: Optional[int] = None
+        self.ready = threading.Event()  # set once the first pass is on `out`
+        self.stats = {"events": 0, "scans": 0, "reported": 0}
+        self._inotify: Optional[Inotify] = None
+        if mode != "scan":
+            try:
+                self._inotify = Inotify()
+            except OSError as e:
+                log(f"seed watcher: {e}, scanning every {self.interval:g}s instead")
+        self.mode = "inotify" if self._inotify else "scan"
+
+    def files(self) -> Set[str]:
+        """Names currently in the seed dir, including ones still being written."""
+        with self._lock:
+            return set(self._known) | set(self._pending)
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="seed-watcher", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if self._inotify:
+                    self._run_inotify()
+                else:
+                    self._run_scan()
+            except Exception as e:
+                self.log(f"seed watcher failed: {e}")
+                time.sleep(self.interval)
+
+    def _run_scan(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        self._scan(settle=False)
+        self.ready.set()
+        while True:
+            time.sleep(self.interval)
+            self._scan(settle=True)
+
+    def _run_inotify(self) -> None:
+        self._watch()
+        # scan after the watch is in place: nothing that lands in between is missed
+        self._scan(settle=False)
+        self.ready.set()
+        next_rescan = time.monotonic() + self.rescan if self.rescan > 0 else None
+        while True:
+            if self._wd is None:
+                timeout = self.interval
+            elif next_rescan is None:
+                timeout = None
+            else:
+                timeout = max(0.0, next_rescan - time.monotonic())
+            rescan = False
+            for wd, mask, name in self._inotify.read(timeout):
+                self.stats["events"] += 1
+                if mask & IN_Q_OVERFLOW:
+                    rescan = True
+                elif mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                    if wd == self._wd:
+                        self._wd = None
+                        rescan = True
+                elif name and not mask & IN_ISDIR and wd == self._wd:
+                    self._check(name)
+            if self._wd is None:
+                try:
+                    self._watch()
+                    rescan = True
+                except OSError:
+                    continue
+            if rescan:
+                self._scan(settle=False)
+            elif next_rescan is not None and time.monotonic() >= next_rescan:
+                self._scan(settle=True)
+            if next_rescan is not None and time.monotonic() >= next_rescan:
+                next_rescan = time.monotonic() + self.rescan
+
+    def _watch(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        self._wd = self._inotify.add_watch(self.root, WATCH_MASK)
+
+    @staticmethod
+    def _ident(path: str) -> Optional[Ident]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return tuple(file_identity(st)) if stat.S_ISREG(st.st_mode) else None
+
+    def _check(self, name: str) -> None:
+        """One inotify event: report the file if its identity differs from the last one reported."""
+        if name.endswith(PARTIAL_SUFFIXES):
+            return
+        ident = self._ident(os.path.join(self.root, name))
+        with self._lock:
+            self._pending.pop(name, None)
+            old = self._known.get(name)
+            if ident == old:
+                return
+            if ident is None:
+                del self._known[name]
+            else:
+                self._known[name] = ident
+        self._emit(name, ident is not None)
+
+    def _scan(self, settle: bool) -> None:
+        """Diff the directory against what was reported; `settle` holds back identities seen for the first time."""
+        self.stats["scans"] += 1
+        seen: Dict[str, Ident] = {}
+        try:
+            with os.scandir(self.root) as it:
+                for e in it:
+                    if e.name.endswith(PARTIAL_SUFFIXES):
+                        continue
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    if stat.S_ISREG(st.st_mode):
+                        seen[e.name] = tuple(file_identity(st))
+        except FileNotFoundError:
+            pass
+        changed, gone = [], []
+        with self._lock:
+            for name, ident in seen.items():
+                if self._known.get(name) == ident:
+                    self._pending.pop(name, None)
+                    continue
+                if settle and self._pending.get(name) != ident:
+                    self._pending[name] = ident
+                    continue
+                self._pending.pop(name, None)
+                self._known[name] = ident
+                changed.append(name)
+            gone = [n for n in self._known if n not in seen]
+            for name in gone:
+                del self._known[name]
+            for name in [n for n in self._pending if n not in seen]:
+                del self._pending[name]
+        for name in changed:
+            self._emit(name, True)
+        for name in gone:
+            self._emit(name, False)
+
+    def _emit(self, name: str, present: bool) -> None:
+        self.stats["reported"] += 1
+        self.out.put((name, present))
@@ -0,0 +1,76 @@
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel for owner TTLs.
+
+    Every key lives in the slot of its deadline; a refresh (REGISTER) moves it to the
+    slot of the new deadline in O(1). The GC cursor only walks slots that came due, so
+    a pass costs O(expired keys) instead of re-checking live owners. One level is
+    enough because every deadline is at most `horizon` ahead; keys that are further
+    out simply stay in their slot until the cursor comes round again.
+    """
+
+    def __init__(self, horizon: float, resolution: float = 1.0, now: float = 0.0):
+        self.resolution = max(0.001, resolution)
+        n = 1
+        while n * self.resolution <= horizon:
+            n *= 2
+        self._slots: List[Set[Hashable]] = [set() for _ in range(n * 2)]
+        self._where: Dict[Hashable, Tuple[int, float]] = {}  # key -> (slot, deadline)
+        self._tick = self._tick_of(now)  # next tick the cursor processes
+
+    def _tick_of(self, t: float) -> int:
+        return int(t // self.resolution)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """Add or move `key`."""
+        self.cancel(key)
+        # past deadlines go to the cursor's slot so the next pass picks them up
+        slot = max(self._tick_of(deadline), self._tick) % len(self._slots)
+        self._slots[slot].add(key)
+        self._where[key] = (slot, deadline)
+
+    def cancel(self, key: Hashable) -> None:
+        ent = self._where.pop(key, None)
+        if ent is not None:
+            self._slots[ent[0]].discard(key)
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        ent = self._where.get(key)
+        return ent[1] if ent else None
+
+    def expired(self, now: float, limit: int = 0) -> List[Hashable]:
+        """
+        Pop keys whose deadline passed, at most `limit` (0 = all) so the caller can
+        drop its lock between batches; the cursor resumes where it stopped.
+        """
+        out: List[Hashable] = []
+        end = self._tick_of(now)
+        # a clock jump longer than the wheel visits every slot once
+        self._tick = max(self._tick, end - len(self._slots) + 1)
+        while self._tick <= end:
+            slot = self._slots[self._tick % len(self._slots)]
+            # set.pop() resumes where it left off; iterating would rescan the slot's deleted entries every batch
+            later = []
+            while slot and not (limit and len(out) >= limit):
+                key = slot.pop()
+                if self._where[key][1] <= now:
+                    del self._where[key]
+                    out.append(key)
+                else:
+                    later.append(key)  # a deadline one or more wheel turns ahead
+            slot.update(later)
+            if limit and len(out) >= limit:
+                return out
+            if self._tick == end:
+                break  # the current slot may still get keys that are due later in this tick
+            self._tick += 1
+        return out
@@ -0,0 +1,96 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Iterator, List
+
+
+class HoldStats:
+    """Lock hold-time histogram for one label (log2 buckets in microseconds)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets: List[int] = [0] * 40
+
+    def add(self, dt: float) -> None:
+        self.count += 1
+        self.total += dt
+        if dt > self.max:
+            self.max = dt
+        self.buckets[min(len(self.buckets) - 1, int(dt * 1e6).bit_length())] += 1
+
+    def merge(self, other: "HoldStats") -> None:
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile, in seconds."""
+        need = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= need:
+                return min(self.max, (1 << i) / 1e6)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "n": self.count,
+            "avg_us": round(self.total / self.count * 1e6, 1) if self.count else 0.0,
+            "p99_us": round(self.quantile(0.99) * 1e6, 1),
+            "max_us": round(self.max * 1e6, 1),
+        }
+
+
+class TimedLock:
+    """
+    threading.Lock that records how long each holder kept it, per label
+    (handler mode, "gc", "persist" ...):
+
+        with self.locked("NEED"):
+            ...
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, HoldStats] = {}
+
+    @contextmanager
+    def __call__(self, label: str) -> Iterator[None]:
+        with self._lock:
+            t0 = time.perf_counter()
+            try:
+                yield
+            finally:
+                # still under the lock, so the stats need no lock of their own
+                st = self._stats.get(label)
+                if st is None:
+                    st = self._stats[label] = HoldStats()
+                st.add(time.perf_counter() - t0)
+
+    def stats(self, reset: bool = False) -> Dict[str, HoldStats]:
+        """Per-label histograms (copies, or the live ones handed over when resetting)."""
+        with self._lock:
+            if reset:
+                out, self._stats = self._stats, {}
+                return out
+            out = {}
+            for label, st in self._stats.items():
+                out[label] = HoldStats()
+                out[label].merge(st)
+            return out
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        return {label: st.summary() for label, st in sorted(self.stats(reset).items())}
+
+
+def merged_snapshot(locks: Iterable[TimedLock], reset: bool = False) -> Dict[str, Dict[str, Any]]:
+    """One summary per label across several locks, e.g. every shard of the swarm table."""
+    acc: Dict[str, HoldStats] = {}
+    for lock in locks:
+        for label, st in lock.stats(reset).items():
+            acc.setdefault(label, HoldStats()).merge(st)
+    return {label: st.summary() for label, st in sorted(acc.items())}
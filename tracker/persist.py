@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Any, Callable, Iterable, Optional
+
+# ihs=None -> every swarm; a missing ih maps to None (swarm was removed)
+ExportFn = Callable[[Optional[Iterable[str]]], Dict[str, Optional[Dict[str, Any]]]]
+
+
+class SwarmStore:
+    """
+    Write-behind persistence of the tracker swarm table.
+
+    - handlers only mark an infohash dirty; a flusher thread wakes every `interval`
+      seconds and appends one record per dirty swarm to swarm.log, so a burst of
+      OWN/EXIT on a swarm costs one line instead of one full rewrite each
+    - records hold the whole swarm entry (or null when it is gone), so replaying the
+      log on top of the snapshot is idempotent
+    - every `compact_every` records the log is folded into a fresh swarm.json snapshot
+      and truncated; a crash between the two steps only replays records the snapshot
+      already contains
+    The table is read through `export`, which copies entries under the tracker's own
+    lock; all file I/O happens outside it.
+    """
+
+    def __init__(
+        self,
+        db_dir: str,
+        export: ExportFn,
+        log: Callable[[str], None],
+        interval: float = 1.0,
+        compact_every: int = 10000,
+    ):
+        self.db_dir = db_dir
+        self.snapshot_path = os.path.join(db_dir, "swarm.json")
+        self.log_path = os.path.join(db_dir, "swarm.log")
+        self.export = export
+        self._log = log
+        self.interval = max(0.05, interval)
+        self.compact_every = max(1, compact_every)
+        self._lock = threading.Lock()  # dirty set
+        self._io_lock = threading.Lock()  # flush vs compact
+        self._dirty = set()
+        self.records = 0  # records in the log since the last compaction
+        self.writes = 0
+        self.compactions = 0
+
+    # ---------------- load ----------------
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Snapshot + log replay. A torn last log line (crash mid-append) is ignored."""
+        swarm: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as fp:
+                    swarm = json.load(fp)
+            except Exception as e:
+                self._log(f"swarm snapshot unreadable, starting empty: {e}")
+                swarm = {}
+        replayed = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as fp:
+                for line in fp:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if rec.get("sw") is None:
+                        swarm.pop(rec.get("ih"), None)
+                    else:
+                        swarm[rec["ih"]] = rec["sw"]
+                    replayed += 1
+        self.records = replayed
+        if replayed:
+            self._log(f"swarm db: replayed {replayed} log records")
+        return swarm
+
+    # ---------------- write-behind ----------------
+    def mark(self, ih: str) -> None:
+        with self._lock:
+            self._dirty.add(ih)
+
+    def start(self) -> None:
+        threading.Thread(target=self._flush_loop, name="swarm-store", daemon=True).start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self._log(f"save db failed: {e}")
+
+    def flush(self) -> None:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        with self._io_lock:
+            # exported under the I/O lock so a concurrent compaction can never be followed by older records
+            entries = self.export(dirty)
+            lines = [json.dumps({"ih": ih, "sw": entries.get(ih)}, ensure_ascii=False, separators=(",", ":")) for ih in dirty]
+            with open(self.log_path, "a", encoding="utf-8") as fp:
+                fp.write("\n".join(lines) + "\n")
+                fp.flush()
+                os.fsync(fp.fileno())
+            self.records += len(lines)
+            self.writes += 1
+        if self.records >= self.compact_every:
+            self.compact()
+
+    def compact(self) -> None:
+        with self._io_lock:
+            t0 = time.time()
+            snap = self.export(None)
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as fp:
+                json.dump(snap, fp, ensure_ascii=False, separators=(",", ":"))
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp, self.snapshot_path)
+            # everything up to here is in the snapshot; records appended later go to a fresh log
+            open(self.log_path, "w").close()
+            folded, self.records = self.records, 0
+            self.compactions += 1
+        self._log(f"swarm db compacted: {len(snap)} swarms, {folded} log records folded in {time.time() - t0:.2f}s")
+
+    def close(self) -> None:
+        """Final flush + compaction (clean shutdown)."""
+        self.flush()
+        self.compact()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            dirty = len(self._dirty)
+        return {"dirty": dirty, "log_records": self.records, "writes": self.writes, "compactions": self.compactions}
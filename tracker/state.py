@@ -0,0 +1,478 @@
+import os
+import time
+import bisect
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple, Optional, Iterable, Set
+
+from common.constants import LIST_PAGE_BYTES, MODE_OWN, MODE_NEED, MODE_LIST, MODE_FIND_BY_NAME, MODE_REGISTER, MODE_EXIT
+from tracker.expiry import TimerWheel
+from tracker.lockstats import TimedLock, merged_snapshot
+from common.utils import jencode, ih_fold
+
+# LIST entry: (infohash, item, encoded size of the item)
+Entry = Tuple[str, Dict[str, Any], int]
+
+
+class Shard:
+    """One slice of the swarm table with its own lock, owner wheel and provisional set."""
+
+    def __init__(self, ttl: float, now: float):
+        self.locked = TimedLock()
+        # infohash -> {meta:{...}, owners:[{node_id,host,port}], last_seen:{node_id:ts}}
+        self.swarm: Dict[str, Dict[str, Any]] = {}
+        # (ih, node_id) -> deadline; REGISTER moves the owner, GC pops only what came due
+        self.expiry = TimerWheel(horizon=ttl, now=now)
+        # warm-started owners that have not announced since the restart
+        self.provisional: Set[Tuple[str, str]] = set()
+        # this shard's part of the LIST snapshot, rebuilt when `version` moved past it
+        self.version = 0
+        self.items: Tuple[int, List[Entry]] = (-1, [])
+
+
+class SwarmTable:
+    """
+    Tracker swarm table, sharded by infohash.
+
+    - every shard has its own lock, so heartbeats and lookups for swarms in different
+      shards never wait for each other
+    - the filename/node indexes span shards and sit behind `index`; it is only ever
+      taken inside a shard lock (or alone), never the other way round
+    - LIST is answered from an immutable snapshot that is rebuilt only after a change
+      to owners or metadata, and then only for the shards that changed; reading an
+      up-to-date snapshot takes no lock at all
+    - every change gets a version number and goes into a bounded change log, so a
+      client that already has the catalogue only fetches what changed since its last
+      poll; `epoch` tells it when the numbering restarted with the tracker
+    - nodes that send node-level keepalives are tracked in `nodes`, one deadline per
+      node instead of one per (swarm, node); their per-owner wheel entries are skipped
+      when they come due and the node leaves all its swarms when its own deadline passes
+    """
+
+    def __init__(self, ttl: float, shards: int = 16, gc_batch: int = 512,
+                 now: Optional[float] = None, cow_list: bool = True, history: int = 65536):
+        now = time.time() if now is None else now
+        self.ttl = ttl
+        self.gc_batch = max(1, gc_batch)  # expirations per shard lock hold
+        self.shards = [Shard(ttl, now) for _ in range(max(1, shards))]
+        self.index = TimedLock()
+        self.by_name: Dict[str, Set[str]] = {}  # filename -> infohashes
+        self.by_node: Dict[str, Set[str]] = {}  # node_id -> infohashes it owns
+        self.node_fold: Dict[str, int] = {}  # node_id -> XOR of ih_fold() over by_node[node_id]
+        # node keepalives: node_id -> deadline, behind its own lock (taken last, after shard/index)
+        self.live = TimedLock()
+        self.nodes = TimerWheel(horizon=ttl, now=now)
+        self.provisional_nodes: Set[str] = set()  # warm-started nodes whose owners are unconfirmed
+        # copy-on-write LIST: every change takes the next version number (under the index
+        # lock); a snapshot built at version v is current as long as nothing took a newer one
+        self.cow_list = cow_list
+        self.version = 0
+        self._list: Tuple[int, List[Entry], List[str]] = (-1, [], [])
+        self.list_builds = 0
+        # change log: infohash -> (version, item or None if removed, size), oldest change first;
+        # `floor` is the newest version that fell out of it
+        self.epoch = os.urandom(4).hex()
+        self.history = max(1, history)
+        self._changes: "OrderedDict[str, Tuple[int, Optional[Dict[str, Any]], int]]" = OrderedDict()
+        self.floor = 0
+
+    def _slot(self, ih: Optional[str]) -> int:
+        # str hashes are cached on the object and spread even when keys share a prefix
+        # (sequential test infohashes); the table lives in one process, so per-run
+        # hash randomisation does not matter
+        return hash(ih) % len(self.shards)
+
+    def shard(self, ih: Optional[str]) -> Shard:
+        return self.shards[self._slot(ih)]
+
+    def _changed(self, sh: Shard, ih: str, sw: Optional[Dict[str, Any]]):
+        """Record a change of `ih` (sw=None: removed). Caller holds the shard lock and the index lock."""
+        self.version += 1
+        sh.version = self.version
+        item = None if sw is None else self._item(ih, sw)
+        self._changes.pop(ih, None)
+        self._changes[ih] = (self.version, item, len(ih) + 3 if item is None else len(jencode(item)))
+        if len(self._changes) > self.history:
+            self.floor = self._changes.popitem(last=False)[1][0]
+
+    # ---------------- load ----------------
+    def load(self, swarm: Dict[str, Dict[str, Any]], now: float) -> None:
+        """
+        Warm start from the persisted table: owners answer lookups right away, but only as
+        provisional peers until they REGISTER/OWN again; the silent ones expire after one TTL.
+        """
+        for ih, sw in swarm.items():
+            owners = sw.get("owners") or []
+            if not owners or "meta" not in sw:
+                continue
+            sh = self.shard(ih)
+            # restart the TTL from boot: the persisted last_seen is as old as the downtime
+            sw["last_seen"] = {str(o.get("node_id")): now for o in owners}
+            sh.swarm[ih] = sw
+            self.by_name.setdefault(sw["meta"].get("filename"), set()).add(ih)
+            for o in owners:
+                nid = str(o.get("node_id"))
+                sh.provisional.add((ih, nid))
+                self.provisional_nodes.add(nid)
+                self._index_node(nid, ih)
+                sh.expiry.schedule((ih, nid), now + self.ttl)
+        # one version for the whole load; nobody can hold an older one from this epoch
+        self.version += 1
+        self.floor = self.version
+        for sh in self.shards:
+            sh.version = self.version
+
+    # ---------------- handlers ----------------
+    def register(self, ih: str, nid: str) -> None:
+        sh = self.shard(ih)
+        with sh.locked(MODE_REGISTER):
+            sw = sh.swarm.get(ih)
+            if sw is None:
+                return
+            now = time.time()
+            sw.setdefault("last_seen", {})[nid] = now
+            sh.provisional.discard((ih, nid))
+            if (ih, nid) in sh.expiry:
+                sh.expiry.schedule((ih, nid), now + self.ttl)
+
+    def own(self, ih: str, meta: Dict[str, Any], owner: Dict[str, Any]) -> None:
+        nid = str(owner["node_id"])
+        sh = self.shard(ih)
+        with sh.locked(MODE_OWN):
+            now = time.time()
+            sw = sh.swarm.get(ih)
+            fresh = sw is None
+            if fresh:
+                sw = sh.swarm[ih] = {"meta": meta, "owners": [], "last_seen": {}}
+            else:
+                old_name = sw["meta"].get("filename")
+                sw["meta"] = meta
+            # one entry per node: a finished download replaces its partial entry
+            sw["owners"] = [o for o in sw["owners"] if str(o.get("node_id")) != nid] + [owner]
+            sw["last_seen"][nid] = now
+            sh.provisional.discard((ih, nid))
+            with self.live(MODE_OWN):
+                keepalive = nid in self.nodes
+                if keepalive:
+                    self.nodes.schedule(nid, now + self.ttl)
+            if keepalive:
+                sh.expiry.cancel((ih, nid))
+            else:
+                sh.expiry.schedule((ih, nid), now + self.ttl)
+            with self.index(MODE_OWN):
+                if not fresh and old_name != meta.get("filename"):
+                    self._unindex_name(ih, old_name)
+                self.by_name.setdefault(meta.get("filename"), set()).add(ih)
+                self._index_node(nid, ih)
+                self._changed(sh, ih, sw)
+
+    def keepalive(self, nid: str, owned: int, digest: str) -> bool:
+        """
+        Node-level REGISTER: one deadline for every swarm the node owns. True if the node's
+        count and digest of owned infohashes match ours, False if it should resync.
+        """
+        self._touch(nid)
+        with self.index(MODE_REGISTER):
+            ihs = self.by_node.get(nid, ())
+            return len(ihs) == owned and f"{self.node_fold.get(nid, 0):016x}" == digest
+
+    def sync(self, nid: str, ihs: List[str], lo: Optional[str], hi: Optional[str]) -> Tuple[List[str], List[str]]:
+        """
+        Batched REGISTER after a digest mismatch: `ihs` is everything the node owns in the
+        infohash range (lo, hi] (open ends as None). Owners we have in that range that the
+        node no longer claims are dropped. Returns (infohashes it has to OWN again, changed swarms).
+        """
+        self._touch(nid)
+
+        def inside(ih: str) -> bool:
+            return (lo is None or ih > lo) and (hi is None or ih <= hi)
+        claimed = {ih for ih in ihs if isinstance(ih, str)}
+        with self.index(MODE_REGISTER):
+            held = {ih for ih in self.by_node.get(nid, ()) if inside(ih)}
+        changed = []
+        for ih in held - claimed:
+            sh = self.shard(ih)
+            with sh.locked(MODE_REGISTER):
+                if self._drop_owner(sh, ih, nid, MODE_REGISTER):
+                    changed.append(ih)
+        return sorted(claimed - held), changed
+
+    def _touch(self, nid: str) -> None:
+        with self.live(MODE_REGISTER):
+            self.nodes.schedule(nid, time.time() + self.ttl)
+            if nid not in self.provisional_nodes:
+                return
+            self.provisional_nodes.discard(nid)
+        # first keepalive after a warm start confirms all of the node's owners at once
+        with self.index(MODE_REGISTER):
+            ihs = list(self.by_node.get(nid, ()))
+        for ih in ihs:
+            sh = self.shard(ih)
+            with sh.locked(MODE_REGISTER):
+                sh.provisional.discard((ih, nid))
+
+    def need(self, ih: str) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """(meta, peers) or None if the swarm is unknown."""
+        sh = self.shard(ih)
+        with sh.locked(MODE_NEED):
+            sw = sh.swarm.get(ih)
+            if sw is None:
+                return None
+            return sw["meta"], self._peers(sh, ih, sw)
+
+    def need_many(self, ihs: List[str], budget: int = LIST_PAGE_BYTES):
+        """
+        Peers (and filename) of many swarms, each shard locked once: (found, missing,
+        rest). `rest` are the infohashes that no longer fit in `budget` encoded bytes.
+        """
+        groups: Dict[int, List[str]] = {}
+        for ih in ihs:
+            if isinstance(ih, str):
+                groups.setdefault(self._slot(ih), []).append(ih)
+        got = {}
+        for i, keys in groups.items():
+            sh = self.shards[i]
+            with sh.locked(MODE_NEED):
+                for ih in keys:
+                    sw = sh.swarm.get(ih)
+                    if sw is not None:
+                        got[ih] = {"filename": sw["meta"].get("filename"), "peers": self._peers(sh, ih, sw)}
+        found, missing, rest, used = {}, [], [], 0
+        for ih in ihs:
+            if not isinstance(ih, str) or ih in found:
+                continue
+            ent = got.get(ih)
+            if ent is None:
+                missing.append(ih)
+                continue
+            size = len(ih) + len(jencode(ent)) + 4
+            if rest or (found and used + size > budget):
+                rest.append(ih)
+                continue
+            found[ih] = ent
+            used += size
+        return found, missing, rest
+
+    def _snapshot(self) -> Tuple[int, List[Entry], List[str]]:
+        """(version, entries sorted by infohash, their infohashes). Shared between callers: do not modify."""
+        snap = self._list
+        if self.cow_list and snap[0] == self.version:
+            return snap
+        version = self.version  # read before the scan: a change during it leaves the result stale
+        entries: List[Entry] = []
+        for sh in self.shards:
+            part_version, part = sh.items
+            if not self.cow_list or part_version != sh.version:
+                with sh.locked(MODE_LIST):
+                    part_version = sh.version
+                    items = [self._item(ih, sw) for ih, sw in sh.swarm.items()]
+                # sizes are only needed for paging; encode outside the lock
+                part = [(it["infohash"], it, len(jencode(it))) for it in items]
+                sh.items = (part_version, part)
+            entries.extend(part)
+        entries.sort(key=lambda e: e[0])
+        snap = self._list = (version, entries, [e[0] for e in entries])
+        self.list_builds += 1
+        return snap
+
+    def list_page(self, cursor: Optional[str] = None, budget: int = LIST_PAGE_BYTES):
+        """
+        Catalogue page in infohash order, starting after `cursor`, holding items worth at
+        most `budget` encoded bytes. Returns (version, items, next cursor or None).
+        Pages may come from different snapshots; the version of the first one is where a
+        `changes()` poll has to start.
+        """
+        version, entries, keys = self._snapshot()
+        i = bisect.bisect_right(keys, cursor) if cursor else 0
+        items, used = [], 0
+        while i < len(entries) and (not items or used + entries[i][2] <= budget):
+            items.append(entries[i][1])
+            used += entries[i][2] + 1
+            i += 1
+        return version, items, (keys[i - 1] if i < len(entries) else None)
+
+    def changes(self, since: int, budget: int = LIST_PAGE_BYTES):
+        """
+        What changed after version `since`, oldest first: (version, items, removed
+        infohashes, more). `version` is where the next poll starts; `more` means the page
+        was full. None if `since` is older than the log, so the caller has to list again.
+        """
+        with self.index(MODE_LIST):
+            if not isinstance(since, int) or since < self.floor or since > self.version:
+                return None
+            recent = []
+            for ih, ent in reversed(self._changes.items()):
+                if ent[0] <= since:
+                    break
+                recent.append((ih, ent))
+        items, removed, used, version = [], [], 0, since
+        for ih, (v, item, size) in reversed(recent):
+            if (items or removed) and used + size > budget:
+                return version, items, removed, True
+            if item is None:
+                removed.append(ih)
+            else:
+                items.append(item)
+            used += size + 1
+            version = v
+        return version, items, removed, False
+
+    def find(self, name: str) -> List[Dict[str, Any]]:
+        with self.index(MODE_FIND_BY_NAME):
+            ihs = list(self.by_name.get(name, ()))
+        matches = []
+        for ih in ihs:
+            sh = self.shard(ih)
+            with sh.locked(MODE_FIND_BY_NAME):
+                sw = sh.swarm.get(ih)
+                # the swarm may have gone or been renamed since the index was read
+                if sw is not None and sw["meta"].get("filename") == name:
+                    matches.append(self._item(ih, sw))
+        return matches
+
+    def leave(self, nid: str, ih: Optional[str] = None, label: str = MODE_EXIT) -> List[str]:
+        """Drop the node from one swarm, or from every swarm it owns. Returns the changed infohashes."""
+        if ih:
+            ihs = [ih]
+        else:
+            with self.index(label):
+                ihs = list(self.by_node.get(nid, ()))
+        changed = []
+        for i in ihs:
+            sh = self.shard(i)
+            with sh.locked(label):
+                if self._drop_owner(sh, i, nid, label):
+                    changed.append(i)
+        return changed
+
+    # ---------------- gc / persistence ----------------
+    def expire(self, now: float) -> Tuple[int, List[str]]:
+        """
+        One GC batch per shard and one of silent nodes. Returns (largest batch popped,
+        changed swarms); a full batch means the caller should go again.
+        """
+        popped, changed = 0, []
+        for sh in self.shards:
+            with sh.locked("gc"):
+                due = sh.expiry.expired(now, self.gc_batch)
+                # `nid in nodes` without the live lock: a stale answer only delays the drop to the node's deadline
+                changed.extend(ih for ih, nid in due if nid not in self.nodes and self._drop_owner(sh, ih, nid, "gc"))
+            popped = max(popped, len(due))
+        with self.live("gc"):
+            gone = self.nodes.expired(now, self.gc_batch)
+        for nid in gone:
+            # a keepalive racing with this drop finds a digest mismatch next time and resyncs
+            changed.extend(self.leave(nid, label="gc"))
+        return max(popped, len(gone)), changed
+
+    def export(self, ihs: Optional[Iterable[str]] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Copies of swarm entries for the persister (None = removed). Only the copy runs under the shard locks."""
+        if ihs is None:
+            groups = {i: None for i in range(len(self.shards))}
+        else:
+            groups = {}
+            for ih in ihs:
+                groups.setdefault(self._slot(ih), []).append(ih)
+        out = {}
+        for i, keys in groups.items():
+            sh = self.shards[i]
+            with sh.locked("persist"):
+                for ih in (list(sh.swarm.keys()) if keys is None else keys):
+                    sw = sh.swarm.get(ih)
+                    # meta is replaced, never mutated, so it can be shared
+                    out[ih] = None if sw is None else {
+                        "meta": sw.get("meta"),
+                        "owners": list(sw.get("owners", [])),
+                        "last_seen": dict(sw.get("last_seen", {})),
+                    }
+        return out
+
+    def counts(self) -> Dict[str, Any]:
+        # len() of a dict/set is atomic; the totals are only a rough view anyway
+        return {
+            "swarms": sum(len(sh.swarm) for sh in self.shards),
+            "owners": sum(len(ihs) for ihs in list(self.by_node.values())),
+            "nodes": len(self.nodes),
+            "provisional": sum(len(sh.provisional) for sh in self.shards),
+            "shards": len(self.shards),
+            "list_builds": self.list_builds,
+            "version": self.version,
+        }
+
+    def lock_stats(self, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Hold times per label over all shards, plus the index lock as `index.<label>`."""
+        out = merged_snapshot((sh.locked for sh in self.shards), reset)
+        out.update({f"index.{k}": v for k, v in self.index.snapshot(reset).items()})
+        out.update({f"live.{k}": v for k, v in self.live.snapshot(reset).items()})
+        return out
+
+    # ---------------- helpers (caller holds the shard lock) ----------------
+    def _index_node(self, nid: str, ih: str):
+        ihs = self.by_node.setdefault(nid, set())
+        if ih not in ihs:
+            ihs.add(ih)
+            self.node_fold[nid] = self.node_fold.get(nid, 0) ^ ih_fold(ih)
+
+    def _unindex_node(self, nid: str, ih: str):
+        ihs = self.by_node.get(nid)
+        if ihs is None or ih not in ihs:
+            return
+        ihs.discard(ih)
+        if ihs:
+            self.node_fold[nid] ^= ih_fold(ih)
+        else:
+            del self.by_node[nid]
+            self.node_fold.pop(nid, None)
+
+    def _unindex_name(self, ih: str, name):
+        ihs = self.by_name.get(name)
+        if ihs is not None:
+            ihs.discard(ih)
+            if not ihs:
+                del self.by_name[name]
+
+    def _drop_owner(self, sh: Shard, ih: str, nid: str, label: str) -> bool:
+        """Remove one owner (and the swarm with its last owner). True if anything changed."""
+        sh.expiry.cancel((ih, nid))
+        sh.provisional.discard((ih, nid))
+        sw = sh.swarm.get(ih)
+        changed = gone = False
+        if sw is not None:
+            owners = [o for o in sw["owners"] if str(o.get("node_id")) != nid]
+            changed = len(owners) != len(sw["owners"])
+            sw["owners"] = owners
+            sw.get("last_seen", {}).pop(nid, None)
+            if not owners:
+                del sh.swarm[ih]
+                changed = gone = True
+        with self.index(label):
+            self._unindex_node(nid, ih)
+            if gone:
+                self._unindex_name(ih, sw["meta"].get("filename"))
+            if changed:
+                self._changed(sh, ih, None if gone else sw)
+        return changed
+
+    def _peers(self, sh: Shard, ih: str, sw: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Owners for NEED: confirmed first, then flagged provisional ones."""
+        owners = sw["owners"]
+        if not sh.provisional:
+            return owners
+        confirmed, provisional = [], []
+        for o in owners:
+            if (ih, str(o.get("node_id"))) in sh.provisional:
+                provisional.append(dict(o, provisional=True))
+            else:
+                confirmed.append(o)
+        return confirmed + provisional
+
+    @staticmethod
+    def _item(ih: str, sw: Dict[str, Any]) -> Dict[str, Any]:
+        meta = sw.get("meta", {})
+        return {
+            "infohash": ih,
+            "filename": meta.get("filename"),
+            "size": meta.get("size"),
+            # compact announces carry the count instead of the hash list
+            "pieces": len(meta.get("piece_hashes") or []) or meta.get("pieces", 0),
+            "peers": len(sw.get("owners", []) or []),
+        }
@@ -1,159 +1,289 @@
-import os, socket, threading, time, json
-from typing import Dict, Any
-from common.constants import BUFFER_SIZE, TRACKER_PORT, MODE_OWN, MODE_NEED, MODE_LIST, MODE_FIND_BY_NAME, MODE_REGISTER, MODE_EXIT
+import os, socket, threading, time, signal, sys
+from collections import deque
+from typing import Dict, Any, List, Tuple
+
+if __name__ == "__main__" and not __package__:
+    # `python tracker/tracker.py`: this directory would shadow the tracker package
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from common.constants import BUFFER_SIZE, SOCK_RCVBUF, TRACKER_PORT, MODE_OWN, MODE_NEED, MODE_LIST, MODE_FIND_BY_NAME, MODE_REGISTER, MODE_EXIT, MODE_STATS
 from common.utils import jencode, jdecode
+from tracker.persist import SwarmStore
+from tracker.state import SwarmTable
 
 class Tracker:
     def __init__(self):
         self.addr = ("0.0.0.0", TRACKER_PORT)
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # heartbeats of a large swarm arrive in bursts; let the kernel hold them while the workers catch up
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_RCVBUF)
         self.sock.bind(self.addr)
-        self.lock = threading.Lock()
 
-        # swarm: infohash -> {meta:{...}, owners:[{node_id,host,port}], last_seen:{node_id:ts}}
-        self.swarm: Dict[str, Dict[str, Any]] = {}
+        # fixed worker pool fed by a bounded queue instead of a thread per datagram
+        self.workers = max(1, int(os.getenv("TRACKER_WORKERS", "4")))
+        self.recv_batch = max(1, int(os.getenv("TRACKER_RECV_BATCH", "64")))
+        self.queue_max = max(16, int(os.getenv("TRACKER_QUEUE", "4096")))
+        self.shed_at = self.queue_max * 3 // 4
+        self._queue: "deque[Tuple[Dict[str, Any], Any]]" = deque()
+        self._qlock = threading.Lock()
+        self._not_empty = threading.Condition(self._qlock)
+        self._not_full = threading.Condition(self._qlock)
+        self._shedding = False
+        self._shed_logged = 0.0
+        self.stats = {"received": 0, "batches": 0, "dispatched": 0, "shed": 0, "busy": 0, "max_depth": 0}
+
         self.ttl = int(os.getenv("TRACKER_TTL_SEC", "60"))
+        self.gc_batch = max(1, int(os.getenv("TRACKER_GC_BATCH", "512")))  # expirations per lock hold
+        self.stats_every = float(os.getenv("TRACKER_STATS_SEC", "60"))  # lock hold-time report, 0 = off
+        # swarms sharded by infohash, one lock each; LIST reads a copy-on-write snapshot
+        self.table = SwarmTable(
+            self.ttl,
+            shards=int(os.getenv("TRACKER_SHARDS", "16")),
+            gc_batch=self.gc_batch,
+        )
         self.db_dir = os.getenv("TRACKER_DB_DIR", "/app/tracker_db")
         os.makedirs(self.db_dir, exist_ok=True)
+        # write-behind: handlers mark swarms dirty, a flusher appends them to swarm.log off the lock
+        self.store = SwarmStore(
+            self.db_dir,
+            self.table.export,
+            self._log,
+            interval=float(os.getenv("TRACKER_PERSIST_SEC", "1.0")),
+            compact_every=int(os.getenv("TRACKER_COMPACT_RECORDS", "10000")),
+        )
+
+        t0 = time.perf_counter()
+        self.table.load(self.store.load(), time.time())
+        counts = self.table.counts()
+        self._log(f"swarm db: {counts['swarms']} swarms, {counts['provisional']} provisional owners "
+                  f"loaded in {(time.perf_counter() - t0) * 1000:.1f}ms ({counts['shards']} shards)")
 
     def _log(self, msg: str):
         ts = time.strftime("%Y-%m-%dT%H:%M:%S")
         print(f"{ts} [TRACKER] {msg}", flush=True)
 
-    def _save_db(self):
-        try:
-            with self.lock:
-                path = os.path.join(self.db_dir, "swarm.json")
-                tmp = path + ".tmp"
-                with open(tmp, "w", encoding="utf-8") as fp:
-                    json.dump(self.swarm, fp, ensure_ascii=False, indent=2)
-                os.replace(tmp, path)
-        except Exception as e:
-            self._log(f"save db failed: {e}")
-
     def _gc_loop(self):
+        """Incremental: each batch takes a shard lock once, so lookups interleave with a large expiry wave."""
+        next_report = time.time() + self.stats_every
         while True:
-            time.sleep(10)
-            now = time.time()
-            changed = False
-            with self.lock:
-                for ih in list(self.swarm.keys()):
-                    sw = self.swarm[ih]
-                    last_seen = sw.get("last_seen", {})
-                    owners = sw.get("owners", [])
-                    alive = []
-                    for o in owners:
-                        nid = str(o.get("node_id"))
-                        ts = last_seen.get(nid, 0)
-                        if now - ts <= self.ttl:
-                            alive.append(o)
-                    if len(alive) != len(owners):
-                        sw["owners"] = alive
-                        changed = True
-                    if not sw["owners"]:
-                        self.swarm.pop(ih, None)
-                        changed = True
-            if changed:
-                self._save_db()
+            time.sleep(1)
+            while True:
+                popped, changed = self.table.expire(time.time())
+                for ih in changed:
+                    self.store.mark(ih)
+                if popped < self.gc_batch:
+                    break
+            if self.stats_every > 0 and time.time() >= next_report:
+                next_report = time.time() + self.stats_every
+                self._report_locks()
+
+    def _report_locks(self):
+        snap = self.table.lock_stats(reset=True)
+        if snap:
+            parts = [f"{k} n={v['n']} p99={v['p99_us']}us max={v['max_us']}us" for k, v in snap.items()]
+            self._log(f"lock hold ({self.stats_every:.0f}s): " + " | ".join(parts))
+
+    def _reply(self, msg: Dict[str, Any], resp: Dict[str, Any], addr):
+        # clients with several requests in flight match replies by the request id they sent
+        if "rid" in msg:
+            resp["rid"] = msg["rid"]
+        self.sock.sendto(jencode(resp), addr)
 
     def handle(self, msg: Dict[str, Any], addr):
         mode = msg.get("mode")
 
         if mode == MODE_REGISTER:
             ih = msg.get("infohash")
+            if ih:
+                # per-swarm heartbeat (older nodes), no reply
+                self.table.register(ih, str(msg.get("node_id")))
+                return
             nid = str(msg.get("node_id"))
-            with self.lock:
-                if ih and ih in self.swarm:
-                    self.swarm[ih].setdefault("last_seen", {})[nid] = time.time()
+            if "infohashes" in msg:
+                # resync batch: the node's owned infohashes in (lo, hi]
+                missing, changed = self.table.sync(nid, msg["infohashes"] or [], msg.get("lo"), msg.get("hi"))
+                for i in changed:
+                    self.store.mark(i)
+                if missing or changed:
+                    self._log(f"REGISTER resync node={nid}: {len(missing)} to re-announce, {len(changed)} dropped")
+                resp = {"ok": True, "missing": missing, "dropped": len(changed)}
+            else:
+                # node keepalive: covers every swarm the node owns, the digest tells if we agree on which
+                in_sync = self.table.keepalive(nid, int(msg.get("owned", 0)), str(msg.get("digest", "")))
+                resp = {"ok": True, "resync": not in_sync}
+            self._reply(msg, resp, addr)
             return
 
         if mode == MODE_OWN:
             ih = msg["infohash"]
             meta = msg["meta"]
             owner = {"node_id": msg["node_id"], "host": msg["host"], "port": msg["port"]}
-            with self.lock:
-                sw = self.swarm.setdefault(ih, {"meta": meta, "owners": [], "last_seen": {}})
-                sw["meta"] = meta
-                if owner not in sw["owners"]:
-                    sw["owners"].append(owner)
-                sw["last_seen"][str(owner["node_id"])] = time.time()
-            self._log(f"OWN ih={ih[:10]}.. file={meta.get('filename')} owner={owner['host']}:{owner['port']}")
-            self._save_db()
+            if msg.get("partial"):
+                # downloader that serves its verified pieces; peers learn which via BITFIELD
+                owner["partial"] = True
+            self.table.own(ih, meta, owner)
+            kind = "partial " if owner.get("partial") else ""
+            self._log(f"OWN {kind}ih={ih[:10]}.. file={meta.get('filename')} owner={owner['host']}:{owner['port']}")
+            self.store.mark(ih)
+            return
+
+        if mode == MODE_NEED and "infohashes" in msg:
+            # batched lookup for fan-out queries: peers and filename per swarm, no meta;
+            # whatever did not fit the reply comes back in `rest` to be asked again
+            found, missing, rest = self.table.need_many(msg["infohashes"] or [])
+            self._reply(msg, {"ok": True, "swarms": found, "missing": missing, "rest": rest}, addr)
             return
 
         if mode == MODE_NEED:
             ih = msg.get("infohash")
-            with self.lock:
-                sw = self.swarm.get(ih)
-                if not sw:
-                    resp = {"ok": False, "error": "NOT_FOUND", "infohash": ih}
-                else:
-                    resp = {"ok": True, "infohash": ih, "meta": sw["meta"], "peers": sw["owners"]}
-            self.sock.sendto(jencode(resp), addr)
+            found = self.table.need(ih)
+            if not found:
+                resp = {"ok": False, "error": "NOT_FOUND", "infohash": ih}
+            else:
+                resp = {"ok": True, "infohash": ih, "meta": found[0], "peers": found[1]}
+            self._reply(msg, resp, addr)
             return
 
         if mode == MODE_LIST:
-            with self.lock:
-                items = []
-                for ih, sw in self.swarm.items():
-                    meta = sw.get("meta", {})
-                    items.append({
-                        "infohash": ih,
-                        "filename": meta.get("filename"),
-                        "size": meta.get("size"),
-                        "pieces": len(meta.get("piece_hashes", []) or []),
-                        "peers": len(sw.get("owners", []) or []),
-                    })
-            self.sock.sendto(jencode({"ok": True, "items": items}), addr)
+            # the catalogue no longer fits one datagram: pages in infohash order (`cursor`),
+            # or only what changed after `since` during this tracker run (`epoch`)
+            epoch = self.table.epoch
+            since = msg.get("since")
+            if since is not None:
+                delta = self.table.changes(since) if msg.get("epoch") == epoch else None
+                if delta is None:
+                    # change log no longer covers `since`, or the tracker restarted: list again
+                    resp = {"ok": True, "epoch": epoch, "reset": True}
+                else:
+                    version, items, removed, more = delta
+                    resp = {"ok": True, "epoch": epoch, "version": version, "items": items, "removed": removed, "more": more}
+            else:
+                version, items, nxt = self.table.list_page(msg.get("cursor"))
+                resp = {"ok": True, "epoch": epoch, "version": version, "items": items, "next": nxt}
+            self._reply(msg, resp, addr)
             return
 
         if mode == MODE_FIND_BY_NAME:
             name = msg.get("filename")
-            with self.lock:
-                matches = []
-                for ih, sw in self.swarm.items():
-                    meta = sw.get("meta", {})
-                    if meta.get("filename") == name:
-                        matches.append({
-                            "infohash": ih,
-                            "filename": meta.get("filename"),
-                            "size": meta.get("size"),
-                            "pieces": len(meta.get("piece_hashes", []) or []),
-                            "peers": len(sw.get("owners", []) or []),
-                        })
+            matches = self.table.find(name)
             if not matches:
                 resp = {"ok": False, "error": "NOT_FOUND", "filename": name, "matches": []}
             elif len(matches) == 1:
                 resp = {"ok": True, "filename": name, "match": matches[0]}
             else:
                 resp = {"ok": False, "error": "AMBIGUOUS", "filename": name, "matches": matches}
-            self.sock.sendto(jencode(resp), addr)
+            self._reply(msg, resp, addr)
+            return
+
+        if mode == MODE_STATS:
+            resp = {
+                "ok": True,
+                **self.table.counts(),
+                "locks": self.table.lock_stats(),
+                "queue": dict(self.stats, depth=len(self._queue)),
+                "store": self.store.stats(),
+            }
+            self._reply(msg, resp, addr)
             return
 
         if mode == MODE_EXIT:
-            nid = msg.get("node_id")
+            nid = str(msg.get("node_id"))
             ih = msg.get("infohash")
-            with self.lock:
-                if ih and ih in self.swarm:
-                    sw = self.swarm[ih]
-                    sw["owners"] = [o for o in sw.get("owners", []) if o.get("node_id") != nid]
-                    sw.get("last_seen", {}).pop(str(nid), None)
-                    if not sw["owners"]:
-                        self.swarm.pop(ih, None)
-            self._log(f"EXIT node={nid} ih={str(ih)[:10]}..")
-            self._save_db()
+            # no infohash: the node leaves every swarm it owns
+            changed = self.table.leave(nid, ih)
+            what = f"ih={str(ih)[:10]}.." if ih else f"all swarms ({len(changed)})"
+            self._log(f"EXIT node={nid} {what}")
+            for i in changed:
+                self.store.mark(i)
             return
 
-    def serve(self):
-        self._log(f"listening udp {self.addr[0]}:{self.addr[1]}")
-        threading.Thread(target=self._gc_loop, daemon=True).start()
-        while True:
-            data, addr = self.sock.recvfrom(BUFFER_SIZE)
+    # ---------------- receive / dispatch ----------------
+    def _recv_batch(self) -> List[Tuple[bytes, Any]]:
+        """Block for one datagram, then drain whatever else is already queued in the kernel (up to recv_batch)."""
+        batch = [self.sock.recvfrom(BUFFER_SIZE)]
+        while len(batch) < self.recv_batch:
+            try:
+                batch.append(self.sock.recvfrom(BUFFER_SIZE, socket.MSG_DONTWAIT))
+            except (BlockingIOError, InterruptedError):
+                break
+        return batch
+
+    def _admit(self, batch: List[Tuple[bytes, Any]]):
+        """
+        Load shedding once the queue is 3/4 full: REGISTER heartbeats are dropped (the TTL is
+        several heartbeats long), NEED/LIST/FIND get an immediate BUSY instead of a late answer.
+        OWN/EXIT change state and are always queued; a full queue stops the receiver instead.
+        """
+        with self._qlock:
+            depth = len(self._queue)
+        # hysteresis: keep shedding until the queue is back under 1/4
+        shedding = depth >= self.shed_at or (self._shedding and depth > self.queue_max // 4)
+        if shedding != self._shedding:
+            self._shedding = shedding
+            if shedding and time.time() - self._shed_logged >= 5:
+                self._shed_logged = time.time()
+                self._log(f"overloaded (queue={depth}): shedding REGISTER, answering BUSY "
+                          f"(so far shed={self.stats['shed']} busy={self.stats['busy']})")
+        keep = []
+        for data, addr in batch:
             try:
                 msg = jdecode(data)
             except Exception:
                 continue
-            threading.Thread(target=self.handle, args=(msg, addr), daemon=True).start()
+            if shedding:
+                mode = msg.get("mode")
+                if mode == MODE_REGISTER:
+                    self.stats["shed"] += 1
+                    continue
+                if mode in (MODE_NEED, MODE_LIST, MODE_FIND_BY_NAME):
+                    self.stats["busy"] += 1
+                    try:
+                        self._reply(msg, {"ok": False, "error": "BUSY", "retry_after": 1}, addr)
+                    except OSError:
+                        pass
+                    continue
+            keep.append((msg, addr))
+        with self._qlock:
+            self._queue.extend(keep)
+            self.stats["received"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self._queue))
+            self._not_empty.notify(len(keep))
+            # backpressure: stop reading and let the socket buffer absorb the burst
+            while len(self._queue) >= self.queue_max:
+                self._not_full.wait()
+
+    def _worker(self):
+        while True:
+            with self._qlock:
+                while not self._queue:
+                    self._not_empty.wait()
+                msg, addr = self._queue.popleft()
+                self.stats["dispatched"] += 1
+                if len(self._queue) <= self.queue_max // 2:
+                    self._not_full.notify()
+            try:
+                self.handle(msg, addr)
+            except Exception as e:
+                self._log(f"handle {msg.get('mode')} failed: {e}")
+
+    def serve(self):
+        self._log(f"listening udp {self.addr[0]}:{self.addr[1]} workers={self.workers} queue={self.queue_max}")
+        # docker stop sends SIGTERM: exit through the finally below so pending changes are written
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        self.store.start()
+        threading.Thread(target=self._gc_loop, daemon=True).start()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"tracker-worker-{i}", daemon=True).start()
+        try:
+            while True:
+                try:
+                    batch = self._recv_batch()
+                except OSError:
+                    continue
+                self._admit(batch)
+        finally:
+            self.store.close()
 
 if __name__ == "__main__":
     Tracker().serve()